@@ -0,0 +1,460 @@
+"""
+Lasttest für den XPSystem-Cog.
+
+Baut den Cog gegen eine temporäre Datenbank und treibt ``on_message`` sowie die
+Slash-Befehle mit Fake-Objekten an, es wird also kein Netzwerk benötigt.
+Das Ergebnis wird als JSON ausgegeben, damit Versionen vergleichbar bleiben.
+
+Mit ``--processes`` wird zusätzlich der Shard-Betrieb gemessen: mehrere Prozesse mit je
+einer eigenen Gilde schreiben über einen gemeinsamen Storage-Dienst.
+
+Beispiel::
+
+    python benchmarks/bench_xpsystem.py --users 100,10000 --achievements 10 --challenges 0,10 -o bench.json
+    python benchmarks/bench_xpsystem.py --processes 1,2,4
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cogs.coinsystem import XPSystem  # noqa: E402
+from utils.storage_service import WRITE_BATCH, run_service  # noqa: E402
+
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+        self.name = f"rolle-{role_id}"
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+
+    async def set_permissions(self, member, **overwrites):
+        pass
+
+    def permissions_for(self, member):
+        return types.SimpleNamespace(read_messages=True)
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.members = {}
+        self.roles = {}
+        self.channels = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return self.roles.setdefault(role_id, FakeRole(role_id))
+
+    def get_channel(self, channel_id):
+        return self.channels.setdefault(channel_id, FakeChannel(channel_id))
+
+
+class FakeMember:
+    def __init__(self, user_id, guild):
+        self.id = user_id
+        self.bot = False
+        self.guild = guild
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.guild_permissions = None
+        self.roles = {}
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    async def add_roles(self, *roles):
+        self.roles.update((role.id, role) for role in roles)
+
+    async def send(self, content=None, **kwargs):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, author, content):
+        self.author = author
+        self.guild = author.guild
+        self.content = content
+        self.channel = None
+
+
+class FakeContext:
+    def __init__(self, author):
+        self.author = author
+        self.guild = author.guild
+        self.responses = []
+
+    async def respond(self, content=None, **kwargs):
+        self.responses.append(content)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+class FakeBot:
+    def __init__(self, config, loop):
+        self.config = config
+        self.loop = loop
+        self.users = {}
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        return self.users[user_id]
+
+
+class SQLCounter:
+    """Zählt Statements und Commits über den Trace-Callback der Storage-Verbindungen."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.commits = 0
+
+    def __call__(self, sql):
+        keyword = sql.lstrip()[:6].upper()
+        with self._lock:
+            if keyword == "COMMIT":
+                self.commits += 1
+            elif keyword != "BEGIN":
+                self.statements += 1
+
+    def reset(self):
+        with self._lock:
+            self.statements = self.commits = 0
+
+
+# Slash-Befehle und ihre Argumente (neben ctx)
+COMMANDS = {
+    "rank": lambda scenario: (),
+    "leaderboard": lambda scenario: (),
+    "buy": lambda scenario: (f"item-{random.randrange(scenario['shop_items'])}",),
+    "daily": lambda scenario: (),
+    "achievements": lambda scenario: (),
+    "shop": lambda scenario: (),
+    "weekly_challenges": lambda scenario: (),
+    "activity": lambda scenario: (),
+}
+
+
+def db_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def seed(path, scenario, guild_id):
+    """Füllt die Datenbank direkt über sqlite3, bevor der Cog für die Messung gebaut wird."""
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (guild_id, user_id, xp, level, coins, prestige) VALUES (?, ?, ?, ?, ?, ?)",
+            [(guild_id, user_id, random.randrange(100), random.randint(1, 50), random.randrange(5000), random.randrange(3))
+             for user_id in range(1, scenario["users"] + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO achievements (guild_id, name, description, condition, reward) VALUES (?, ?, ?, ?, ?)",
+            [(guild_id, f"Level {level}", f"Erreiche Level {level}", f"level >= {level}", "100 Coins")
+             for level in range(2, scenario["achievements"] + 2)]
+        )
+        conn.executemany(
+            "INSERT INTO weekly_challenges (guild_id, name, description, condition, reward) VALUES (?, ?, ?, ?, ?)",
+            [(guild_id, f"Challenge {i}", "Schreibe Nachrichten", f"messages >= {100 * (i + 1)}", "1000 Coins")
+             for i in range(scenario["challenges"])]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO rewards (guild_id, level, reward_type, reward_value) VALUES (?, ?, ?, ?)",
+            [(guild_id, level, ("coins", "role", "badge")[level % 3], "100" if level % 3 == 0 else str(level)) for level in range(2, 60)]
+        )
+        conn.executemany(
+            "INSERT INTO shop (guild_id, item_name, item_price, item_role) VALUES (?, ?, ?, ?)",
+            [(guild_id, f"item-{i}", 10 + i, None) for i in range(scenario["shop_items"])]
+        )
+        now = datetime.datetime.now()
+        conn.execute(
+            "INSERT INTO season (guild_id, start_date, end_date, status) VALUES (?, ?, ?, 'active')",
+            (guild_id, now.isoformat(), (now + datetime.timedelta(days=30)).isoformat())
+        )
+    conn.close()
+
+
+async def run_scenario(scenario, workdir):
+    path = os.path.join(workdir, "celestix.db")
+    loop = asyncio.get_running_loop()
+    config = {"xp_system": dict(
+        scenario["settings"],
+        database=path,
+        metrics_file=os.path.join(workdir, "metrics.prom"),
+        # Backups würden sonst beim Start mitlaufen und die Messung verfälschen
+        backup={"interval_hours": 0},
+    )}
+
+    # Erster Durchlauf legt nur das Schema an
+    cog = XPSystem(FakeBot(config, loop))
+    cog.cog_unload()
+    guild = FakeGuild(1)
+    seed(path, scenario, guild.id)
+
+    bot = FakeBot(config, loop)
+    for user_id in range(1, scenario["users"] + 1):
+        guild.members[user_id] = bot.users[user_id] = FakeMember(user_id, guild)
+    members = list(guild.members.values())
+
+    cog = XPSystem(bot)
+    counter = SQLCounter()
+    cog.db.set_trace(counter)
+    size_before = db_size(path)
+
+    # Nachrichten
+    latencies = []
+    counter.reset()
+    started = time.perf_counter()
+    for _ in range(scenario["messages"]):
+        message = FakeMessage(random.choice(members), scenario["content"])
+        t0 = time.perf_counter()
+        await cog.on_message(message)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    # Gepufferte Schreibzugriffe gehören zur Last der Nachrichten dazu
+    await cog.flush_xp()
+    await cog.rewards.join()
+    elapsed = time.perf_counter() - started
+    messages = {
+        "count": scenario["messages"],
+        "per_second": scenario["messages"] / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles(latencies),
+        "statements_per_message": counter.statements / scenario["messages"],
+        "commits_per_message": counter.commits / scenario["messages"],
+    }
+
+    # Slash-Befehle
+    commands = {}
+    for name, make_args in COMMANDS.items():
+        command = getattr(cog, name)
+        latencies = []
+        errors = 0
+        counter.reset()
+        for _ in range(scenario["commands"]):
+            ctx = FakeContext(random.choice(members))
+            t0 = time.perf_counter()
+            try:
+                await command.callback(cog, ctx, *make_args(scenario))
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+        commands[name] = {
+            "count": scenario["commands"],
+            "errors": errors,
+            "latency_ms": percentiles(latencies),
+            "statements_per_call": counter.statements / scenario["commands"],
+            "commits_per_call": counter.commits / scenario["commands"],
+        }
+
+    cog.cog_unload()
+    return {
+        "scenario": {key: value for key, value in scenario.items() if key != "settings"},
+        "settings": scenario["settings"],
+        "messages": messages,
+        "commands": commands,
+        "db_bytes": {"before": size_before, "after": db_size(path), "growth": db_size(path) - size_before},
+    }
+
+
+async def drive_shard(scenario, path, service, guild_id, barrier):
+    loop = asyncio.get_running_loop()
+    config = {"xp_system": dict(scenario["settings"], database=path, metrics_file=None, backup={"interval_hours": 0})}
+    bot = FakeBot(config, loop)
+    bot.storage_service = service
+    bot.process_index = guild_id - 1
+    guild = FakeGuild(guild_id)
+    for user_id in range(1, scenario["users"] + 1):
+        guild.members[user_id] = bot.users[user_id] = FakeMember(user_id, guild)
+    members = list(guild.members.values())
+
+    cog = XPSystem(bot)
+    # Alle Prozesse beginnen gleichzeitig, sonst misst man die Startzeit mit
+    await loop.run_in_executor(None, barrier.wait)
+    latencies = []
+    started = time.time()
+    for _ in range(scenario["messages"]):
+        message = FakeMessage(random.choice(members), scenario["content"])
+        t0 = time.perf_counter()
+        await cog.on_message(message)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    await cog.flush_xp()
+    await cog.rewards.join()
+    finished = time.time()
+    cog.cog_unload()
+    return {"started": started, "finished": finished, "latency_ms": percentiles(latencies)}
+
+
+def shard_worker(scenario, path, service, guild_id, barrier, results):
+    warnings.simplefilter("ignore", DeprecationWarning)
+    random.seed(guild_id)
+    with contextlib.redirect_stdout(sys.stderr):
+        results.put(asyncio.run(drive_shard(scenario, path, service, guild_id, barrier)))
+
+
+def run_sharded(scenario, workdir, processes):
+    """Misst den Nachrichtendurchsatz mit ``processes`` Prozessen hinter einem Storage-Dienst."""
+    path = os.path.join(workdir, "celestix.db")
+    for guild_id in range(1, processes + 1):
+        # Gilde 1 hat schon der Durchlauf im selben Prozess angelegt
+        if guild_id > 1:
+            seed(path, scenario, guild_id)
+
+    ready, ready_child = multiprocessing.Pipe(duplex=False)
+    stop = multiprocessing.Event()
+    authkey = os.urandom(16)
+    service = multiprocessing.Process(target=run_service, args=([path], WRITE_BATCH, authkey, ready_child, stop))
+    service.start()
+    ready_child.close()
+    address = ready.recv()
+
+    barrier = multiprocessing.Barrier(processes)
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=shard_worker, args=(scenario, path, (address, authkey), guild_id, barrier, results))
+        for guild_id in range(1, processes + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    shards = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    stop.set()
+    service.join()
+
+    elapsed = max(shard["finished"] for shard in shards) - min(shard["started"] for shard in shards)
+    total = scenario["messages"] * processes
+    return {
+        "processes": processes,
+        "messages": total,
+        "per_second": total / elapsed if elapsed else 0.0,
+        "latency_ms_p99": max(shard["latency_ms"]["p99"] for shard in shards),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(value):
+    return [int(part) for part in value.split(",") if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest für den XPSystem-Cog")
+    parser.add_argument("--users", type=int_list, default=[1000], help="Anzahl User, kommagetrennt für mehrere Szenarien")
+    parser.add_argument("--achievements", type=int_list, default=[10])
+    parser.add_argument("--challenges", type=int_list, default=[10])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--commands", type=int, default=200, help="Aufrufe pro Slash-Befehl")
+    parser.add_argument("--shop-items", type=int, default=20)
+    parser.add_argument("--content", default="Hallo zusammen, wie läuft es bei euch heute?")
+    parser.add_argument("--flush-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=30)
+    parser.add_argument("--rate-limit", action="store_true", help="XP-Drosselung mit den Standardwerten aktiv lassen")
+    parser.add_argument("--processes", type=int_list, default=[], help="Zusätzlich im Shard-Betrieb messen, kommagetrennt")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="JSON-Datei statt stdout")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    random.seed(args.seed)
+    settings = {"flush_size": args.flush_size, "flush_interval": args.flush_interval}
+    if not args.rate_limit:
+        # Sonst würde fast jede Nachricht gedrosselt und der XP-Pfad gar nicht gemessen
+        settings["rate_limit"] = {"user_per_minute": 10 ** 9, "user_burst": 10 ** 9, "guild_per_second": 10 ** 9, "guild_burst": 10 ** 9}
+
+    results = []
+    for users in args.users:
+        for achievements in args.achievements:
+            for challenges in args.challenges:
+                scenario = {
+                    "users": users,
+                    "achievements": achievements,
+                    "challenges": challenges,
+                    "messages": args.messages,
+                    "commands": args.commands,
+                    "shop_items": args.shop_items,
+                    "content": args.content,
+                    "settings": settings,
+                }
+                workdir = tempfile.mkdtemp(prefix="celestix-bench-")
+                try:
+                    # Ausgaben des Cogs (z. B. Migrationen) dürfen das JSON auf stdout nicht stören
+                    with contextlib.redirect_stdout(sys.stderr):
+                        result = asyncio.run(run_scenario(scenario, workdir))
+                        if args.processes:
+                            result["sharded"] = [run_sharded(scenario, workdir, processes) for processes in args.processes]
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+                results.append(result)
+                print(
+                    f"users={users} achievements={achievements} challenges={challenges}: "
+                    f"{result['messages']['per_second']:.0f} msg/s, "
+                    f"p99 {result['messages']['latency_ms']['p99']:.3f} ms, "
+                    f"{result['messages']['statements_per_message']:.3f} SQL/msg",
+                    file=sys.stderr
+                )
+                for sharded in result.get("sharded", ()):
+                    print(
+                        f"  {sharded['processes']} Prozesse: {sharded['per_second']:.0f} msg/s, "
+                        f"p99 {sharded['latency_ms_p99']:.3f} ms",
+                        file=sys.stderr
+                    )
+
+    report = {
+        "benchmark": "xpsystem",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "created": datetime.datetime.now().isoformat(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,120 @@
 import discord
 from discord.ext import commands
 import json
+import multiprocessing
 import os
+import signal
+from multiprocessing.connection import wait
 
+from utils.guilds import database_paths
+from utils.storage_service import WRITE_BATCH, run_service
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
-bot.remove_command('help')
 
 with open("config/config.json") as f:
     config = json.load(f)
 
 
-for filename in os.listdir("./cogs"):
-    if filename.endswith(".py"):
-        bot.load_extension(f"cogs.{filename[:-3]}")
-        print('1')
+def run_bot(config, shard_ids=None, shard_count=None, storage_service=None, process_index=None):
+    intents = discord.Intents.all()
+    if shard_ids is None:
+        bot = commands.Bot(command_prefix="!", intents=intents)
+    else:
+        # Die Slash-Befehle gleicht nur der erste Prozess mit Discord ab
+        bot = commands.AutoShardedBot(
+            command_prefix="!", intents=intents, shard_ids=shard_ids, shard_count=shard_count,
+            auto_sync_commands=process_index == 0
+        )
+    bot.remove_command('help')
+    bot.config = config
+    bot.storage_service = storage_service
+    bot.process_index = process_index
 
+    for filename in os.listdir("./cogs"):
+        if filename.endswith(".py"):
+            bot.load_extension(f"cogs.{filename[:-3]}")
+            print('1')
 
-bot.run(config["token"])
\ No newline at end of file
+    bot.run(config["token"])
+
+
+def run_sharded(config, processes, shard_count, write_batch):
+    """
+    Verteilt die Shards auf mehrere Prozesse, damit der Bot mehr als einen CPU-Kern nutzt.
+
+    Discord schickt alle Ereignisse einer Gilde an denselben Shard, jede Gilde gehört also
+    genau einem Prozess und ihr Zwischenspeicher bleibt gültig. Geschrieben wird nur über
+    einen gemeinsamen Storage-Dienst (:class:`utils.storage_service.StorageService`), der
+    die Schreibzugriffe aller Prozesse bündelt; gelesen wird in jedem Prozess selbst.
+    """
+    settings = config.get("xp_system", {})
+    paths = database_paths(
+        settings.get("database", "database/celestix.db"),
+        settings.get("dedicated_guilds", ()),
+        settings.get("guild_directory", "database/guilds"),
+    )
+    authkey = os.urandom(16)
+
+    # Erst wenn der Dienst alle Migrationen erledigt hat, starten die Shards
+    ready, ready_child = multiprocessing.Pipe(duplex=False)
+    stop = multiprocessing.Event()
+    service = multiprocessing.Process(
+        target=run_service, args=(list(paths.values()), write_batch, authkey, ready_child, stop), name="celestix-storage"
+    )
+    service.start()
+    ready_child.close()
+    try:
+        address = ready.recv()
+    except EOFError:
+        service.join()
+        raise SystemExit("Der Storage-Dienst konnte nicht gestartet werden.")
+
+    workers = []
+    for index in range(processes):
+        shard_ids = list(range(index, shard_count, processes))
+        worker = multiprocessing.Process(
+            target=run_bot, args=(config, shard_ids, shard_count, (address, authkey), index), name=f"celestix-shards-{index}"
+        )
+        worker.start()
+        workers.append(worker)
+        print(f"Prozess {index} gestartet (Shards {', '.join(map(str, shard_ids))} von {shard_count}).")
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        # Endet ein Prozess unerwartet, wird alles beendet, statt mit fehlenden Shards weiterzulaufen
+        wait([worker.sentinel for worker in workers] + [service.sentinel])
+        print("Ein Prozess wurde beendet, fahre alle herunter.")
+        for worker in workers:
+            worker.terminate()
+    except KeyboardInterrupt:
+        # Strg+C erreicht die Shard-Prozesse meist selbst; ein zweites Signal würde ihr Herunterfahren abbrechen
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for worker in workers:
+            worker.join(timeout=10)
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+    for worker in workers:
+        worker.join()
+    # Zuletzt, damit die Shards beim Herunterfahren ihre Puffer noch schreiben konnten
+    stop.set()
+    service.join()
+
+
+def main():
+    sharding = config.get("sharding", {})
+    processes = sharding.get("processes", 1)
+    if processes <= 1:
+        run_bot(config)
+        return
+    shard_count = sharding.get("shard_count") or processes
+    if shard_count < processes:
+        raise SystemExit(f"shard_count ({shard_count}) muss mindestens so groß sein wie processes ({processes}).")
+    run_sharded(config, processes, shard_count, sharding.get("write_batch", WRITE_BATCH))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,341 +1,811 @@
 import discord
 from discord.ext import commands, tasks
-import sqlite3
+import asyncio
 import datetime
+import os
+import time
+
+from utils.achievements import condition_sql, parse_condition
+from utils.activity import PERIODS, compact, current_hour, load_activity_history, load_activity_ranking, sparkline, window_start
+from utils.backup import BackupManager
+from utils.challenges import current_week
+from utils.guilds import GuildRegistry, load_challenges
+from utils.leaderboard import NameCache
+from utils.metrics import LoopLagMonitor, Metrics
+from utils.pagination import PER_PAGE, KeysetPages, page_count, render_page, send_paginated
+from utils.ratelimit import XPRateLimiter
+from utils.rewards import RewardDispatcher
+from utils.shop import purchase
+from utils.storage_service import StorageClient
+
+# Tage im Aktivitätsverlauf von /rank und Plätze in den Ranglisten von /activity
+ACTIVITY_HISTORY_DAYS = 14
+ACTIVITY_TOP = 100
 
 class XPSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.conn = sqlite3.connect("database/celestix.db")
-        self.cursor = self.conn.cursor()
-        self._initialize_db()
-
-    def _initialize_db(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                xp INTEGER DEFAULT 0,
-                level INTEGER DEFAULT 1,
-                coins INTEGER DEFAULT 0,
-                prestige INTEGER DEFAULT 0
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rewards (
-                level INTEGER PRIMARY KEY,
-                reward_type TEXT,
-                reward_value TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS shop (
-                item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                item_name TEXT,
-                item_price INTEGER,
-                item_role TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS season (
-                season_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                start_date TEXT,
-                end_date TEXT,
-                status TEXT DEFAULT 'inaktive'
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_name TEXT,
-                start_date TEXT,
-                end_date TEXT,
-                reward TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS achievements (
-                achievement_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,  -- Name des Achievements
-                description TEXT,  -- Beschreibung des Achievements
-                condition TEXT,  -- Bedingung (z. B. "prestige >= 1", "level >= 25")
-                reward TEXT  -- Belohnung (z. B. "500 Coins", "Exklusive Rolle")
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_achievements (
-                user_id INTEGER,
-                achievement_id INTEGER,
-                completed BOOLEAN DEFAULT FALSE,
-                PRIMARY KEY (user_id, achievement_id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS weekly_challenges (
-                challenge_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                description TEXT,
-                condition TEXT,  -- Bedingung (z. B. "messages >= 100")
-                reward TEXT  -- Belohnung (z. B. "1000 Coins")
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_weekly_progress (
-                user_id INTEGER,
-                challenge_id INTEGER,
-                progress INTEGER DEFAULT 0,
-                PRIMARY KEY (user_id, challenge_id)
-            )
-        """)
-        self.conn.commit()
-    
+        settings = getattr(bot, "config", {}).get("xp_system", {})
+        # Im Shard-Betrieb (siehe bot.py) schreibt nur der Storage-Dienst, dieser Prozess liest selbst.
+        # Aufgaben, die alle Gilden einer Datei betreffen, übernimmt dann nur der erste Prozess
+        service = getattr(bot, "storage_service", None)
+        self.storage_client = StorageClient(*service) if service else None
+        self.process_index = getattr(bot, "process_index", None)
+        self.primary = not self.process_index
+
+        # Alle Daten gehören einer Gilde. Große Gilden können eine eigene Datenbankdatei bekommen,
+        # die Zugriffe laufen immer über Worker-Threads, nie direkt im Event-Loop
+        self.guilds = GuildRegistry(
+            settings.get("database", "database/celestix.db"),
+            dedicated=settings.get("dedicated_guilds", ()),
+            directory=settings.get("guild_directory", "database/guilds"),
+            readers=settings.get("db_readers", 4),
+            flush_size=settings.get("flush_size", 500),
+            client=self.storage_client,
+        )
+        self.db = self.guilds.shared
+
+        # Messwerte sind immer aktiv: Histogramme mit festen Buckets kosten pro Eintrag fast nichts
+        self.metrics_file = settings.get("metrics_file", "database/metrics.prom")
+        if self.process_index is None:
+            self.metrics = Metrics()
+        else:
+            # Eine Datei pro Prozess, unterschieden auch über das Label
+            self.metrics = Metrics(labels={"process": self.process_index})
+            if self.metrics_file:
+                root, ext = os.path.splitext(self.metrics_file)
+                self.metrics_file = f"{root}-{self.process_index}{ext}"
+        self.guilds.set_observer(self.metrics.sql_observer)
+        self.loop_lag = LoopLagMonitor(self.metrics)
+        self.loop_lag.start(bot.loop)
+        self._command_started = {}
+
+        # Drosselt Spam, bevor irgendeine SQL-Arbeit anfällt
+        self.rate_limiter = XPRateLimiter.from_config(settings.get("rate_limit", {}))
+
+        self.check_season.start()
+        self.week = current_week()
+        self.weekly_reset.start()
+
+        # Namen aus dem Member-Cache, gilt für alle Gilden
+        self.names = NameCache(bot)
+
+        # Level-Belohnungen werden im Hintergrund zugestellt
+        self.rewards = RewardDispatcher(workers=settings.get("reward_workers", 2))
+        self.rewards.start(bot.loop)
+
+        self.flush_xp.change_interval(seconds=settings.get("flush_interval", 30))
+        self.flush_xp.start()
+        if self.metrics_file:
+            self.write_metrics.change_interval(seconds=settings.get("metrics_interval", 15))
+            self.write_metrics.start()
+
+        # Online-Backups aller Datenbanken, geprüft wird stündlich, ob eins fällig ist
+        backup = settings.get("backup", {})
+        self.backups = BackupManager.from_config(backup)
+        self.backup_interval = backup.get("interval_hours", 24) * 3600
+        if self.backup_interval > 0 and self.primary:
+            self.scheduled_backup.start()
+
+        # Aktivität pro Stunde und Tag; die 24-Stunden-Rangliste braucht mindestens zwei Tage Stunden-Buckets
+        activity = settings.get("activity", {})
+        self.activity_hourly_days = max(2, activity.get("hourly_days", 2))
+        self.activity_daily_days = activity.get("daily_days", 400)
+        # Neue Zahlen kommen erst mit dem nächsten Flush an, länger muss eine Rangliste nicht gelten
+        self.activity_ttl = settings.get("flush_interval", 30)
+        if self.primary:
+            self.compact_activity.start()
+
+    def cog_unload(self):
+        # Wird auch beim Herunterfahren des Bots aufgerufen, damit keine XP verloren gehen
+        self.flush_xp.cancel()
+        self.check_season.cancel()
+        self.weekly_reset.cancel()
+        self.write_metrics.cancel()
+        self.scheduled_backup.cancel()
+        self.compact_activity.cancel()
+        self.rewards.stop()
+        self.loop_lag.stop()
+        for state in self.guilds.states():
+            state.flush_sync()
+        self.guilds.close()
+        if self.storage_client is not None:
+            self.storage_client.close()
+
+    def _owns(self, guild_id):
+        """Ob die Gilde auf einem Shard dieses Prozesses liegt (Discord verteilt nach ``(id >> 22) % shards``)."""
+        shard_ids = getattr(self.bot, "shard_ids", None)
+        if not shard_ids:
+            return True
+        return (guild_id >> 22) % self.bot.shard_count in shard_ids
+
+    async def _guild_state(self, ctx):
+        # XP, Shop, Season usw. gibt es nur pro Gilde, in Direktnachrichten also nicht
+        if ctx.guild is None:
+            await ctx.respond("Dieser Befehl funktioniert nur auf einem Server.")
+            return None
+        return await self.guilds.get(ctx.guild.id)
+
+    @tasks.loop(seconds=30)
+    async def flush_xp(self):
+        # Ein Fehler (z. B. volle Festplatte) darf weder den Loop beenden noch die übrigen Gilden auslassen
+        for state in self.guilds.states():
+            try:
+                await state.flush()
+            except Exception as e:
+                self.metrics.inc("celestix_flush_errors_total")
+                print(f"Puffer der Gilde {state.guild_id} konnten nicht geschrieben werden, neuer Versuch beim nächsten Flush: {e!r}")
+
+    @tasks.loop(seconds=15)
+    async def write_metrics(self):
+        states = self.guilds.states()
+        self.metrics.set("celestix_guilds_loaded", len(states))
+        self.metrics.set("celestix_xp_buffer_pending", sum(len(state.xp_buffer) for state in states))
+        self.metrics.set("celestix_challenge_buffer_pending", sum(len(state.challenges) for state in states))
+        self.metrics.set("celestix_activity_buffer_pending", sum(len(state.activity) for state in states))
+        self.metrics.set("celestix_reward_queue_length", len(self.rewards))
+        # Schreiben im Thread, damit der Event-Loop nicht auf die Festplatte wartet
+        await asyncio.get_running_loop().run_in_executor(None, self.metrics.write, self.metrics_file)
+
+    @tasks.loop(hours=1)
+    async def scheduled_backup(self):
+        # Nach einem Neustart nicht sofort erneut sichern, wenn das letzte Backup noch frisch ist
+        last = self.backups.last_backup()
+        if last is not None and time.time() - last < self.backup_interval:
+            return
+        # Ein fehlgeschlagenes Backup darf den Loop nicht beenden, die nächste Stunde versucht es erneut
+        try:
+            await self.run_backup()
+        except Exception as e:
+            print(f"Geplantes Backup ist fehlgeschlagen, neuer Versuch in einer Stunde: {e!r}")
+
+    async def run_backup(self):
+        """Schreibt die Puffer und sichert danach alle Datenbanken im Hintergrund-Thread."""
+        for state in self.guilds.states():
+            try:
+                await state.flush()
+            except Exception as e:
+                # Gesichert wird trotzdem, der Puffer bleibt für den nächsten Flush erhalten
+                self.metrics.inc("celestix_flush_errors_total")
+                print(f"Puffer der Gilde {state.guild_id} konnten vor dem Backup nicht geschrieben werden: {e!r}")
+        started = time.perf_counter()
+        try:
+            reports = await self.backups.run([db.path for db in self.guilds.storages()])
+        except Exception:
+            self.metrics.inc("celestix_backup_errors_total")
+            raise
+        self.metrics.observe("celestix_backup_seconds", time.perf_counter() - started)
+        self.metrics.set("celestix_backup_last_success_timestamp", time.time())
+        for report in reports:
+            print(f"Backup von {report['database']} nach {report['backup']} ({report['bytes'] // 1024} KB, {report['seconds']:.1f} s).")
+        return reports
+
+    async def cog_before_invoke(self, ctx):
+        self._command_started[id(ctx)] = time.perf_counter()
+
+    async def cog_after_invoke(self, ctx):
+        started = self._command_started.pop(id(ctx), None)
+        if started is not None:
+            self.metrics.observe("celestix_command_seconds", time.perf_counter() - started, command=ctx.command.qualified_name)
+
+    # Zu jeder vollen Stunde (UTC), damit der Wochenwechsel genau um Montag 0:00 Uhr passiert
+    # und nicht schon Fortschritt aus der neuen Woche mit gelöscht wird
+    @tasks.loop(time=[datetime.time(hour=hour, tzinfo=datetime.timezone.utc) for hour in range(24)])
+    async def weekly_reset(self):
+        # Vor jedem await, damit kein Flush mehr Fortschritt der alten Woche schreibt
+        self._start_week()
+        if self.primary:
+            await self._reset_weeks()
+        # Herausforderungen können direkt in der Datenbank angelegt werden
+        for state in self.guilds.states():
+            try:
+                state.challenges.load(await state.db.read(load_challenges, state.guild_id))
+            except Exception as e:
+                self.metrics.inc("celestix_weekly_reset_errors_total")
+                print(f"Herausforderungen der Gilde {state.guild_id} konnten nicht geladen werden: {e!r}")
+
+    @weekly_reset.before_loop
+    async def _reset_missed_week(self):
+        # Lief der Bot zum Wochenwechsel nicht, sofort nachholen statt bis zur nächsten vollen Stunde zu warten
+        if self.primary:
+            await self._reset_weeks()
+
+    def _start_week(self):
+        # Jeder Prozess verwirft den Puffer seiner eigenen Gilden, auch wenn die Datenbank ein anderer zurücksetzt
+        week = current_week()
+        if week != self.week:
+            for state in self.guilds.states():
+                state.challenges.start_week(week)
+            self.week = week
+
+    async def _reset_weeks(self):
+        # Die Woche wird pro Datenbankdatei festgehalten, nicht pro Gilde
+        week = current_week()
+        for db in self.guilds.storages():
+            try:
+                reset = await db.write(self._reset_weekly_progress, week)
+            except Exception as e:
+                self.metrics.inc("celestix_weekly_reset_errors_total")
+                print(f"Wöchentliche Herausforderungen in {db.path} konnten nicht zurückgesetzt werden, neuer Versuch in einer Stunde: {e!r}")
+                continue
+            if reset:
+                print(f"Wöchentliche Herausforderungen wurden zurückgesetzt ({db.path}).")
+
+    @staticmethod
+    def _reset_weekly_progress(conn, week):
+        # Prüfen und Löschen in einem Schreibzugriff. Gelöscht wird nur Fortschritt älterer Wochen:
+        # was ein Flush (auch aus einem anderen Prozess) schon für die neue Woche geschrieben hat, bleibt
+        last = conn.execute("SELECT value FROM bot_state WHERE key = 'weekly_reset'").fetchone()
+        if last and last[0] == week:
+            return False
+        if last:
+            conn.execute("DELETE FROM user_weekly_progress WHERE week IS NOT ?", (week,))
+        conn.execute(
+            "INSERT INTO bot_state (key, value) VALUES ('weekly_reset', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (week,)
+        )
+        return last is not None
+
     @tasks.loop(hours=1)
     async def check_season(self):
-        season = self.cursor.execute("SELECT end_date FROM season WHERE status = 'active'").fetchone()
-        if season:
-            end_date = datetime.datetime.fromisoformat(season[0])
-            if datetime.datetime.now() >= end_date:
-                self.cursor.execute("UPDATE season SET status = 'ended' WHERE status = 'active'")
-                self.conn.commit()
-                print("Season wurde automatisch beendet.")
-                
+        # Wie bei flush_xp: ein Fehler betrifft nur seine Gilde, der Loop läuft weiter
+        # Unterbrochene Saisonwechsel (z. B. durch einen Neustart) fortsetzen
+        for db in self.guilds.storages():
+            try:
+                interrupted = await db.fetchall("SELECT guild_id, season_id FROM season WHERE status IN ('archiving', 'resetting')")
+            except Exception as e:
+                self.metrics.inc("celestix_season_errors_total")
+                print(f"Unterbrochene Saisonwechsel in {db.path} konnten nicht gelesen werden: {e!r}")
+                continue
+            for guild_id, season_id in interrupted:
+                if not self._owns(guild_id):
+                    continue
+                try:
+                    state = await self.guilds.get(guild_id)
+                    await state.rollover(season_id)
+                except Exception as e:
+                    self.metrics.inc("celestix_season_errors_total")
+                    print(f"Saisonwechsel der Gilde {guild_id} ist fehlgeschlagen, neuer Versuch in einer Stunde: {e!r}")
+                    continue
+                print(f"Saisonwechsel der Gilde {guild_id} wurde fortgesetzt.")
+
+        # Einmal pro Stunde mit der Datenbank abgleichen, falls Seasons von außen angelegt wurden
+        for state in self.guilds.states():
+            try:
+                await state.season.load(state.db)
+                season = state.season
+                if season.status != "active" or not season.expired:
+                    continue
+                # Die nächste Season bekommt dieselbe Länge wie die abgelaufene
+                await state.rollover(season.season_id, season.length_days or 30)
+            except Exception as e:
+                self.metrics.inc("celestix_season_errors_total")
+                print(f"Season der Gilde {state.guild_id} konnte nicht geprüft werden, neuer Versuch in einer Stunde: {e!r}")
+                continue
+            print(f"Season der Gilde {state.guild_id} wurde automatisch beendet und archiviert.")
+
+    @tasks.loop(hours=1)
+    async def compact_activity(self):
+        # Betrifft alle Gilden einer Datei, läuft im Shard-Betrieb daher nur im ersten Prozess
+        for db in self.guilds.storages():
+            # Wie bei flush_xp: ein Fehler darf den Loop nicht beenden, sonst wachsen die Stunden-Buckets unbegrenzt
+            try:
+                days, deleted = await compact(db, self.activity_hourly_days, self.activity_daily_days)
+            except Exception as e:
+                self.metrics.inc("celestix_activity_compaction_errors_total")
+                print(f"Aktivität in {db.path} konnte nicht zusammengefasst werden, neuer Versuch in einer Stunde: {e!r}")
+                continue
+            if days:
+                print(f"Aktivität von {days} Tag(en) zusammengefasst, {deleted} alte Buckets gelöscht ({db.path}).")
+
     @commands.Cog.listener()
     async def on_message(self, message):
-        if message.author.bot:
+        if message.author.bot or message.guild is None:
             return
 
-        # Überprüfe, ob eine aktive Season läuft
-        season = self.cursor.execute("SELECT status FROM season WHERE status = 'active'").fetchone()
-        if not season:
+        observe = self.metrics.observe
+        started = last = time.perf_counter()
+
+        # Überprüfe, ob in dieser Gilde eine aktive Season läuft
+        state = self.guilds.loaded(message.guild.id) or await self.guilds.get(message.guild.id)
+        active = state.season.active
+        now = time.perf_counter()
+        observe("celestix_on_message_seconds", now - last, phase="season")
+        if not active:
             return  # Keine aktive Season, kein XP
 
+        last = now
+        throttled = self.rate_limiter.check(message)
+        now = time.perf_counter()
+        observe("celestix_on_message_seconds", now - last, phase="ratelimit")
+        if throttled:
+            self.metrics.inc("celestix_xp_throttled_total", reason=throttled)
+            return
+
         user_id = message.author.id
-        self.cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
-        self.cursor.execute("UPDATE users SET xp = xp + 10 WHERE user_id = ?", (user_id,))
-        self.conn.commit()
-
-        xp, level = self.cursor.execute("SELECT xp, level FROM users WHERE user_id = ?", (user_id,)).fetchone()
-        xp_needed = level * 100
-
-        if xp >= xp_needed:
-            self.cursor.execute("UPDATE users SET level = level + 1, xp = 0 WHERE user_id = ?", (user_id,))
-            self.conn.commit()
-            await self._give_reward(message.author, level + 1)
-        
-        await self.check_achievements(user_id)
-        await self.update_weekly_progress(user_id)
-
-    async def _give_reward(self, user, level):
-        reward = self.cursor.execute("SELECT reward_type, reward_value FROM rewards WHERE level = ?", (level,)).fetchone()
+        # XP werden nur im Speicher gutgeschrieben und gebündelt geschrieben (siehe flush_xp)
+        last = now
+        xp = 10
+        new_level = await state.xp_buffer.add_xp(user_id, xp)
+        if new_level is not None or user_id not in state.ranking:
+            state.ranking.update(user_id, level=state.xp_buffer.get(user_id)[1])
+        state.activity.record(user_id, xp)
+        if state.xp_buffer.should_flush():
+            await state.xp_buffer.flush()
+        if len(state.activity) >= state.xp_buffer.flush_size:
+            await state.activity.flush(state.db)
+        now = time.perf_counter()
+        observe("celestix_on_message_seconds", now - last, phase="xp")
+
+        last = now
+        self.update_weekly_progress(state, user_id)
+        if new_level is not None:
+            self.update_weekly_progress(state, user_id, "level_ups")
+        if len(state.challenges) >= state.xp_buffer.flush_size:
+            await state.challenges.flush(state.db)
+        now = time.perf_counter()
+        observe("celestix_on_message_seconds", now - last, phase="weekly")
+
+        if new_level is not None or user_id not in state.rewards_checked:
+            last = now
+            if new_level is not None:
+                self._give_reward(state, message.author, new_level)
+                # Die Belohnung des neuen Levels kommt schon aus _give_reward
+                self._reconcile_rewards(state, message.author, new_level)
+            else:
+                self._reconcile_rewards(state, message.author, state.xp_buffer.get(user_id)[1] + 1)
+            state.rewards_checked.add(user_id)
+            now = time.perf_counter()
+            observe("celestix_on_message_seconds", now - last, phase="rewards")
+
+        if new_level is not None:
+            # Achievements hängen nur von Level und Prestige ab, ohne Level-Up ändert sich nichts
+            last = now
+            await self.check_achievements(state, user_id, {"level": (new_level - 1, new_level)})
+            now = time.perf_counter()
+            observe("celestix_on_message_seconds", now - last, phase="achievements")
+
+        observe("celestix_on_message_seconds", now - started, phase="total")
+
+    def _give_reward(self, state, user, level):
+        # Legt die Belohnung nur in die Warteschlange, zugestellt wird von self.rewards
+        reward = state.reward_map.get(level)
         if reward:
             reward_type, reward_value = reward
+            guild = getattr(user, "guild", None)
             if reward_type == "role":
-                role = discord.utils.get(user.guild.roles, id=int(reward_value))
+                role = guild.get_role(int(reward_value)) if guild else None
                 if role:
-                    await user.add_roles(role)
-                    await user.send(f"Glückwunsch! Du hast Level {level} erreicht und die Rolle {role.name} erhalten!")
+                    self.rewards.grant_role(user, role, f"Glückwunsch! Du hast Level {level} erreicht und die Rolle {role.name} erhalten!")
             elif reward_type == "coins":
-                self.cursor.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (int(reward_value), user.id))
-                self.conn.commit()
-                await user.send(f"Glückwunsch! Du hast Level {level} erreicht und {reward_value} Coins erhalten!")
+                # Die Coins gehören zum Spielstand und werden mit dem Level-Up geschrieben, nur die DM kommt aus der Warteschlange
+                amount = int(reward_value)
+                state.xp_buffer.add_coins(user.id, amount)
+                self.rewards.send(user, f"Glückwunsch! Du hast Level {level} erreicht und {amount} Coins erhalten!")
             elif reward_type == "channel":
-                channel = discord.utils.get(user.guild.channels, id=int(reward_value))
+                channel = guild.get_channel(int(reward_value)) if guild else None
                 if channel:
-                    await channel.set_permissions(user, read_messages=True)
-                    await user.send(f"Glückwunsch! Du hast Level {level} erreicht und Zugriff auf den Channel {channel.name} erhalten!")
+                    self.rewards.allow_channel(user, channel, f"Glückwunsch! Du hast Level {level} erreicht und Zugriff auf den Channel {channel.name} erhalten!")
             elif reward_type == "badge":
-                await user.send(f"Glückwunsch! Du hast Level {level} erreicht und ein exklusives Badge erhalten!")
+                self.rewards.send(user, f"Glückwunsch! Du hast Level {level} erreicht und ein exklusives Badge erhalten!")
+
+    def _reconcile_rewards(self, state, member, below):
+        # Rollen und Channel sind erst vergeben, wenn Discord sie gesetzt hat. Was beim Herunterfahren noch
+        # in der Warteschlange lag oder nach allen Wiederholungen scheiterte, wird hier nachgeholt:
+        # beim ersten Level-Check eines Users nach dem Start und bei jedem Level-Up
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            return
+        for level, (reward_type, reward_value) in state.reward_map.items():
+            if level >= below:
+                continue
+            if reward_type == "role":
+                role = guild.get_role(int(reward_value))
+                if role and member.get_role(role.id) is None:
+                    self.rewards.grant_role(member, role)
+            elif reward_type == "channel":
+                channel = guild.get_channel(int(reward_value))
+                if channel and not channel.permissions_for(member).read_messages:
+                    self.rewards.allow_channel(member, channel)
+
+    async def check_achievements(self, state, user_id, changed):
+        """
+        Prüft nur die Achievements, deren Schwelle durch die Änderung überschritten wurde.
+
+        :param state: Der :class:`GuildState` der Gilde.
+        :param user_id: Die ID des Users.
+        :param changed: Die geänderten Werte als ``{stat: (alt, neu)}``.
+        """
+        if not state.achievement_engine.candidates(user_id, changed):
+            return
 
-    async def check_achievements(self, user_id):
-        achievements = self.cursor.execute("SELECT achievement_id, condition FROM achievements").fetchall()
-        user_data = self.cursor.execute("SELECT level, prestige FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        user_data = await state.db.fetchone("SELECT level, prestige FROM users WHERE guild_id = ? AND user_id = ?", (state.guild_id, user_id))
+        buffered = state.xp_buffer.get(user_id)
 
-        if not user_data:
+        if not user_data and not buffered:
             return
 
-        level, prestige = user_data
+        level, prestige = user_data if user_data else (1, 0)
+        if buffered:
+            level = buffered[1]
 
-        for achievement_id, condition in achievements:
-            if eval(condition):  # Bedingung auswerten (z. B. "prestige >= 1")
-                self.cursor.execute("INSERT OR REPLACE INTO user_achievements (user_id, achievement_id, completed) VALUES (?, ?, TRUE)", (user_id, achievement_id))
-                self.conn.commit()
+        unlocked = state.achievement_engine.evaluate(user_id, changed, {"level": level, "prestige": prestige})
+        if unlocked:
+            await state.db.executemany(
+                "INSERT OR REPLACE INTO user_achievements (guild_id, user_id, achievement_id, completed) VALUES (?, ?, ?, TRUE)",
+                [(state.guild_id, user_id, achievement_id) for achievement_id in unlocked]
+            )
 
-    async def update_weekly_progress(self, user_id):
-        challenges = self.cursor.execute("SELECT challenge_id, condition FROM weekly_challenges").fetchall()
-        for challenge_id, condition in challenges:
-            if "messages" in condition:  # Beispiel: "messages >= 100"
-                self.cursor.execute("""
-                    INSERT OR IGNORE INTO user_weekly_progress (user_id, challenge_id, progress)
-                    VALUES (?, ?, 0)
-                """, (user_id, challenge_id))
-                self.cursor.execute("""
-                    UPDATE user_weekly_progress
-                    SET progress = progress + 1
-                    WHERE user_id = ? AND challenge_id = ?
-                """, (user_id, challenge_id))
-                self.conn.commit()
+    def update_weekly_progress(self, state, user_id, event="messages"):
+        # Zählt nur im Speicher, geschrieben wird gesammelt in flush_xp
+        state.challenges.record(user_id, event)
 
     @discord.slash_command(name="prestige", description="Setze dein Level zurück und erhalte Prestige-Belohnungen")
     async def prestige(self, ctx):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
         user_id = ctx.author.id
-        level, prestige = self.cursor.execute("SELECT level, prestige FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        await state.xp_buffer.flush()
+        level, prestige = await state.db.fetchone("SELECT level, prestige FROM users WHERE guild_id = ? AND user_id = ?", (state.guild_id, user_id))
 
         if level < 55:
             await ctx.respond(f"{ctx.author.mention}, du musst Level 55 erreichen, um das Prestige-System zu nutzen!")
             return
 
-        self.cursor.execute("UPDATE users SET level = 1, xp = 0, prestige = prestige + 1 WHERE user_id = ?", (user_id,))
-        self.conn.commit()
+        await state.db.execute("UPDATE users SET level = 1, xp = 0, prestige = prestige + 1 WHERE guild_id = ? AND user_id = ?", (state.guild_id, user_id))
+        state.xp_buffer.forget(user_id)
+        state.ranking.update(user_id, level=1, prestige=prestige + 1)
+        await self.check_achievements(state, user_id, {"level": (level, 1), "prestige": (prestige, prestige + 1)})
 
         await ctx.respond(f"{ctx.author.mention}, du hast dein Level zurückgesetzt und bist jetzt Prestige {prestige + 1}!")
 
     @discord.slash_command(name="add_reward", description="Füge eine Belohnung für ein bestimmtes Level hinzu")
     @commands.has_permissions(administrator=True)
     async def add_reward(self, ctx, level: int, reward_type: str, reward_value: str):
-        self.cursor.execute("INSERT OR REPLACE INTO rewards (level, reward_type, reward_value) VALUES (?, ?, ?)", (level, reward_type, reward_value))
-        self.conn.commit()
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        await state.db.execute(
+            "INSERT OR REPLACE INTO rewards (guild_id, level, reward_type, reward_value) VALUES (?, ?, ?, ?)",
+            (state.guild_id, level, reward_type, reward_value)
+        )
+        state.reward_map[level] = (reward_type, reward_value)
         await ctx.respond(f"Belohnung für Level {level} hinzugefügt: {reward_type} ({reward_value})")
 
     @discord.slash_command(name="shop", description="Zeige den Shop an")
     async def shop(self, ctx):
-        items = self.cursor.execute("SELECT item_name, item_price, item_role FROM shop").fetchall()
-        if not items:
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        if not len(state.shop_catalog):
             await ctx.respond("Der Shop ist leer.")
             return
 
-        response = "**Shop:**\n"
-        for item in items:
-            response += f"- {item[0]} (Preis: {item[1]} Coins)\n"
-        await ctx.respond(response)
+        await send_paginated(ctx, lambda page: self._shop_page(state, page))
+
+    @staticmethod
+    async def _shop_page(state, page):
+        # Der Shop sieht für alle gleich aus, jede Seite wird nur einmal gebaut
+        async def build():
+            pages = page_count(len(state.shop_catalog))
+            lines = [f"- {item_name} (Preis: {item_price} Coins)" for _, item_name, item_price, _ in state.shop_catalog.page(page, PER_PAGE)]
+            return render_page("Shop", lines, page, pages), page + 1 < pages
+
+        return await state.shop_pages.get(page, build)
 
     @discord.slash_command(name="buy", description="Kaufe einen Gegenstand aus dem Shop")
     async def buy(self, ctx, item_name: str):
-        item = self.cursor.execute("SELECT item_price, item_role FROM shop WHERE item_name = ?", (item_name,)).fetchone()
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        item = state.shop_catalog.get(item_name)
         if not item:
             await ctx.respond("Dieser Gegenstand existiert nicht.")
             return
 
-        price, role_id = item
-        user_coins = self.cursor.execute("SELECT coins FROM users WHERE user_id = ?", (ctx.author.id,)).fetchone()[0]
-
-        if user_coins < price:
+        # Gerade erst gutgeschriebene Coins aus Level-Belohnungen müssen vorher in der Datenbank stehen
+        if state.xp_buffer.pending_coins(ctx.author.id):
+            await state.xp_buffer.flush()
+        # Prüfen und Abbuchen in einem bedingten UPDATE, ein einziger Schreibzugriff
+        if not await state.db.write(purchase, state.guild_id, ctx.author.id, item, datetime.datetime.now().isoformat()):
             await ctx.respond(f"Du hast nicht genug Coins, um {item_name} zu kaufen.")
             return
+        self.update_weekly_progress(state, ctx.author.id, "purchases")
 
-        self.cursor.execute("UPDATE users SET coins = coins - ? WHERE user_id = ?", (price, ctx.author.id))
-        self.conn.commit()
-
-        if role_id:
-            role = discord.utils.get(ctx.guild.roles, id=int(role_id))
-            if role:
-                await ctx.author.add_roles(role)
-                await ctx.respond(f"Du hast {item_name} gekauft und die Rolle {role.name} erhalten!")
+        role_id = item[3]
+        role = ctx.guild.get_role(int(role_id)) if role_id else None
+        if role:
+            await ctx.author.add_roles(role)
+            await ctx.respond(f"Du hast {item_name} gekauft und die Rolle {role.name} erhalten!")
         else:
             await ctx.respond(f"Du hast {item_name} gekauft!")
 
     @discord.slash_command(name="add_shop_item", description="Füge einen Gegenstand zum Shop hinzu")
     @commands.has_permissions(administrator=True)
     async def add_shop_item(self, ctx, item_name: str, item_price: int, item_role: discord.Role = None):
-        self.cursor.execute("INSERT INTO shop (item_name, item_price, item_role) VALUES (?, ?, ?)", (item_name, item_price, item_role.id if item_role else None))
-        self.conn.commit()
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        await state.db.execute(
+            "INSERT INTO shop (guild_id, item_name, item_price, item_role) VALUES (?, ?, ?, ?)",
+            (state.guild_id, item_name, item_price, item_role.id if item_role else None)
+        )
+        await state.shop_catalog.load(state.db)
+        state.shop_pages.clear()
         await ctx.respond(f"Gegenstand {item_name} zum Shop hinzugefügt!")
 
     @discord.slash_command(name="remove_shop_item", description="Entferne einen Gegenstand aus dem Shop")
     @commands.has_permissions(administrator=True)
     async def remove_shop_item(self, ctx, item_name: str):
-        self.cursor.execute("DELETE FROM shop WHERE item_name = ?", (item_name,))
-        self.conn.commit()
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        await state.db.execute("DELETE FROM shop WHERE guild_id = ? AND item_name = ?", (state.guild_id, item_name))
+        await state.shop_catalog.load(state.db)
+        state.shop_pages.clear()
         await ctx.respond(f"Gegenstand {item_name} aus dem Shop entfernt!")
 
     @discord.slash_command(name="pause_season", description="Pausiere die aktuelle Season")
     @commands.has_permissions(administrator=True)
 
     async def pause_season(self, ctx):
-        self.cursor.execute("UPDATE season SET status = 'paused' WHERE status = 'active'")
-        self.conn.commit()
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        await state.db.execute("UPDATE season SET status = 'paused' WHERE guild_id = ? AND status = 'active'", (state.guild_id,))
+        state.season.pause()
         await ctx.respond("Die aktuelle Season wurde pausiert.")
 
-    @discord.slash_command(name="end_season", description="Beende die aktuelle Season")
+    @discord.slash_command(name="end_season", description="Beende die aktuelle Season, archiviere die Ergebnisse und starte die nächste")
     @commands.has_permissions(administrator=True)
-    async def end_season(self, ctx):
-        end_date = datetime.datetime.now().isoformat()
-        self.cursor.execute("UPDATE season SET end_date = ?, status = 'ended' WHERE status = 'active'", (end_date,))
-        self.conn.commit()
-        await ctx.respond("Die aktuelle Season wurde beendet.")
+    async def end_season(self, ctx, next_season_days: int = 30):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        season = state.season
+        if season.status not in ("active", "paused"):
+            await ctx.respond("Es gibt keine aktive Season.")
+            return
+
+        # Auf großen Servern dauert das Archivieren, die Interaktion muss vorher bestätigt sein
+        await ctx.defer()
+        new_season_id = await state.rollover(season.season_id, max(next_season_days, 0))
+        if new_season_id:
+            await ctx.respond(f"Die aktuelle Season wurde beendet und archiviert. Die nächste Season läuft {next_season_days} Tage.")
+        else:
+            await ctx.respond("Die aktuelle Season wurde beendet und archiviert.")
+
+    @discord.slash_command(name="season_history", description="Zeige die Endstände einer vergangenen Season an")
+    async def season_history(self, ctx, season_id: int = None):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        # Kommt komplett aus dem Archiv, die Live-Tabellen werden nicht angefasst
+        season = await state.db.fetchone("""
+            SELECT season_id, start_date, end_date FROM season
+            WHERE guild_id = ? AND status = 'ended' AND (?2 IS NULL OR season_id = ?2)
+            ORDER BY season_id DESC LIMIT 1
+        """, (state.guild_id, season_id))
+        if not season:
+            await ctx.respond("Es gibt noch keine abgeschlossene Season." if season_id is None else "Diese Season gibt es nicht.")
+            return
+
+        season_id, start_date, end_date = season
+        last = await state.db.fetchone(
+            "SELECT rank FROM season_results WHERE guild_id = ? AND season_id = ? ORDER BY rank DESC LIMIT 1",
+            (state.guild_id, season_id)
+        )
+        if not last:
+            await ctx.respond(f"Für Season #{season_id} wurden keine Ergebnisse archiviert.")
+            return
+
+        own = await state.db.fetchone(
+            "SELECT rank, level, prestige FROM season_results WHERE guild_id = ? AND user_id = ? AND season_id = ?",
+            (state.guild_id, ctx.author.id, season_id)
+        )
+        if own:
+            footer = f"Dein Platz: #{own[0]} von {last[0]} (Level {own[1]}, Prestige {own[2]})"
+        else:
+            footer = "Du warst in dieser Season nicht dabei."
+
+        async def fetch(after, limit):
+            return await state.db.fetchall("""
+                SELECT rank, user_id, level, prestige FROM season_results
+                WHERE guild_id = ? AND season_id = ? AND rank > ?
+                ORDER BY rank LIMIT ?
+            """, (state.guild_id, season_id, after, limit))
+
+        pages = KeysetPages(fetch)
+        title = f"Season #{season_id} ({(start_date or '?')[:10]} bis {(end_date or '?')[:10]})"
+
+        async def render(page):
+            rows, has_next = await pages.get(page)
+            names = await self.names.resolve(ctx.guild, [user_id for _, user_id, _, _ in rows])
+            lines = [f"{rank}. {names[user_id]} (Level {level}, Prestige {prestige})" for rank, user_id, level, prestige in rows]
+            return render_page(title, lines, page, page_count(last[0]), footer), has_next
+
+        await send_paginated(ctx, render)
     
     @discord.slash_command(name="rank", description="Zeige dein aktuelles Level und Fortschritt an")
     async def rank(self, ctx):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
         user_id = ctx.author.id
-        user_data = self.cursor.execute("SELECT xp, level, prestige FROM users WHERE user_id = ?", (user_id,)).fetchone()
-        if not user_data:
+        user_data = await state.db.fetchone("SELECT xp, level, prestige FROM users WHERE guild_id = ? AND user_id = ?", (state.guild_id, user_id))
+        buffered = state.xp_buffer.get(user_id)
+        if not user_data and not buffered:
             await ctx.respond("Du hast noch keine XP gesammelt.")
             return
 
-        xp, level, prestige = user_data
+        xp, level, prestige = user_data if user_data else (0, 1, 0)
+        if buffered:
+            xp, level = buffered
         xp_needed = level * 100  # Beispiel: 100 XP pro Level
         progress = (xp / xp_needed) * 100  # Fortschritt in Prozent
 
         # Season-Informationen abrufen
-        season = self.cursor.execute("SELECT start_date, end_date, status FROM season ORDER BY season_id DESC LIMIT 1").fetchone()
-        if not season:
+        season = state.season
+        if not season.exists:
             season_info = "Es gibt keine aktive Season."
         else:
-            start_date, end_date, status = season
-            time_left = datetime.datetime.fromisoformat(end_date) - datetime.datetime.now()
+            time_left = season.time_left()
+            if time_left is None:
+                remaining = "unbegrenzt"
+            else:
+                remaining = f"{time_left.days} Tage und {time_left.seconds // 3600} Stunden."
             season_info = (
                 f"**Season-Status:**\n"
-                f"Start: {start_date}\n"
-                f"Ende: {end_date}\n"
-                f"Status: {status}\n"
-                f"Verbleibende Zeit: {time_left.days} Tage und {time_left.seconds // 3600} Stunden."
+                f"Start: {season.start_date}\n"
+                f"Ende: {season.end_date}\n"
+                f"Status: {season.status}\n"
+                f"Verbleibende Zeit: {remaining}"
             )
 
+        # Verlauf der letzten Tage, noch nicht geschriebene Stunden mitgezählt
+        today = current_hour() // 24
+        start_day = today - ACTIVITY_HISTORY_DAYS + 1
+        history = await state.db.read(load_activity_history, state.guild_id, user_id, start_day)
+        for hour, gained in state.activity.pending(user_id).items():
+            history[hour // 24] = history.get(hour // 24, 0) + gained
+        daily_xp = [history.get(day, 0) for day in range(start_day, today + 1)]
+
         await ctx.respond(
             f"**Dein Rang:**\n"
             f"Level: {level}\n"
             f"Prestige: {prestige}\n"
-            f"Fortschritt: {progress:.2f}% (XP: {xp}/{xp_needed})\n\n"
+            f"Fortschritt: {progress:.2f}% (XP: {xp}/{xp_needed})\n"
+            f"Deine Position: #{state.ranking.position(user_id) or len(state.ranking) + 1}\n"
+            f"Aktivität ({ACTIVITY_HISTORY_DAYS} Tage): {sparkline(daily_xp)} ({sum(daily_xp)} XP)\n\n"
             f"{season_info}"
         )
 
     @discord.slash_command(name="daily", description="Hole deine tägliche Belohnung ab")
     async def daily(self, ctx):
-        user_id = ctx.author.id
-        last_daily = self.cursor.execute("SELECT last_daily FROM users WHERE user_id = ?", (user_id,)).fetchone()
-        if last_daily and last_daily[0]:
-            last_daily_date = datetime.datetime.fromisoformat(last_daily[0])
-            if (datetime.datetime.now() - last_daily_date).days < 1:
-                await ctx.respond("Du hast deine tägliche Belohnung bereits abgeholt. Komme morgen wieder!")
-                return
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
 
-        self.cursor.execute("UPDATE users SET coins = coins + 100, last_daily = ? WHERE user_id = ?", (datetime.datetime.now().isoformat(), user_id))
-        self.conn.commit()
+        # Prüfen und Gutschreiben in einem Schreibzugriff: gepufferte XP-Zeilen gibt es noch nicht in der Datenbank
+        claimed = await state.db.write(self._claim_daily, state.guild_id, ctx.author.id, datetime.datetime.now().isoformat())
+        if not claimed:
+            await ctx.respond("Du hast deine tägliche Belohnung bereits abgeholt. Komme morgen wieder!")
+            return
         await ctx.respond(f"{ctx.author.mention}, du hast deine tägliche Belohnung von 100 Coins erhalten!")
 
+    @staticmethod
+    def _claim_daily(conn, guild_id, user_id, now):
+        last_daily = conn.execute("SELECT last_daily FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)).fetchone()
+        if last_daily and last_daily[0]:
+            if (datetime.datetime.fromisoformat(now) - datetime.datetime.fromisoformat(last_daily[0])).days < 1:
+                return False
+        # Der XP-Flush addiert später nur Deltas, eine hier angelegte Zeile geht also nicht verloren
+        conn.execute("""
+            INSERT INTO users (guild_id, user_id, coins, last_daily) VALUES (?, ?, 100, ?)
+            ON CONFLICT(guild_id, user_id) DO UPDATE SET coins = coins + 100, last_daily = excluded.last_daily
+        """, (guild_id, user_id, now))
+        return True
+
     @discord.slash_command(name="leaderboard", description="Zeige das Leaderboard an")
-    async def leaderboard(self, ctx):
-        users = self.cursor.execute("SELECT user_id, level, prestige FROM users ORDER BY level DESC, prestige DESC LIMIT 10").fetchall()
+    async def leaderboard(self, ctx, page: int = 1):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        # Kommt komplett aus der Rangliste der Gilde im Speicher, ohne SQL
+        ranking = state.ranking
+        page = min(max(page, 1), ranking.pages())
+        users = ranking.page(page)
         if not users:
             await ctx.respond("Es gibt noch keine Benutzer im Leaderboard.")
             return
 
-        response = "**Leaderboard:**\n"
-        for i, (user_id, level, prestige) in enumerate(users):
-            user = await self.bot.fetch_user(user_id)
-            response += f"{i + 1}. {user.name} (Level {level}, Prestige {prestige})\n"
+        names = await self.names.resolve(ctx.guild, [user_id for _, user_id, _, _ in users])
+        response = f"**Leaderboard (Seite {page}/{ranking.pages()}):**\n"
+        for position, user_id, level, prestige in users:
+            response += f"{position}. {names[user_id]} (Level {level}, Prestige {prestige})\n"
+
+        position = ranking.position(ctx.author.id)
+        if position:
+            response += f"\nDeine Position: #{position}"
         await ctx.respond(response)
 
+    @discord.slash_command(name="activity", description="Zeige die aktivsten Mitglieder eines Zeitraums an (tag, woche, monat)")
+    async def activity(self, ctx, zeitraum: str = "woche"):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+        period = PERIODS.get(zeitraum.lower())
+        if period is None:
+            await ctx.respond(f"Unbekannter Zeitraum. Möglich sind: {', '.join(PERIODS)}.")
+            return
+
+        title, days = period
+        rows = await self._activity_board(state, zeitraum.lower(), days)
+        if not rows:
+            await ctx.respond(f"{title}: Noch keine Aktivität.")
+            return
+
+        places = {user_id: place for place, (user_id, _, _) in enumerate(rows, start=1)}
+        footer = f"Deine Position: #{places[ctx.author.id]}" if ctx.author.id in places else None
+
+        async def render(page):
+            entries = rows[page * PER_PAGE:(page + 1) * PER_PAGE]
+            names = await self.names.resolve(ctx.guild, [user_id for user_id, _, _ in entries])
+            lines = [
+                f"{page * PER_PAGE + index}. {names[user_id]} ({xp} XP, {messages} Nachrichten)"
+                for index, (user_id, messages, xp) in enumerate(entries, start=1)
+            ]
+            return render_page(f"Aktivität – {title}", lines, page, page_count(len(rows)), footer), (page + 1) * PER_PAGE < len(rows)
+
+        await send_paginated(ctx, render)
+
+    async def _activity_board(self, state, period, days):
+        cached = state.activity_boards.get(period)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        # Höchstens einmal pro Gültigkeitsdauer, damit auch die letzten Nachrichten mitzählen
+        await state.activity.flush(state.db)
+        rows = await state.db.read(load_activity_ranking, state.guild_id, window_start(days), ACTIVITY_TOP)
+        state.activity_boards[period] = (time.monotonic() + self.activity_ttl, rows)
+        return rows
+
     @discord.slash_command(name="start_event", description="Starte ein Event")
     @commands.has_permissions(administrator=True)
     async def start_event(self, ctx, event_name: str, duration_days: int, reward: str):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
         start_date = datetime.datetime.now().isoformat()
         end_date = (datetime.datetime.now() + datetime.timedelta(days=duration_days)).isoformat()
-        self.cursor.execute("INSERT INTO events (event_name, start_date, end_date, reward) VALUES (?, ?, ?, ?)", (event_name, start_date, end_date, reward))
-        self.conn.commit()
+        await state.db.execute(
+            "INSERT INTO events (guild_id, event_name, start_date, end_date, reward) VALUES (?, ?, ?, ?, ?)",
+            (state.guild_id, event_name, start_date, end_date, reward)
+        )
         await ctx.respond(f"Event {event_name} gestartet! Es endet in {duration_days} Tagen.")
 
     @discord.slash_command(name="event_info", description="Zeige Informationen zum aktuellen Event an")
     async def event_info(self, ctx):
-        event = self.cursor.execute("SELECT event_name, start_date, end_date, reward FROM events ORDER BY event_id DESC LIMIT 1").fetchone()
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
+        event = await state.db.fetchone(
+            "SELECT event_name, start_date, end_date, reward FROM events WHERE guild_id = ? ORDER BY event_id DESC LIMIT 1",
+            (state.guild_id,)
+        )
         if not event:
             await ctx.respond("Es gibt kein aktives Event.")
             return
@@ -352,62 +822,147 @@ class XPSystem(commands.Cog):
         )
     @discord.slash_command(name="achievements", description="Zeige deine Achievements an")
     async def achievements(self, ctx):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
         user_id = ctx.author.id
+        engine = state.achievement_engine
 
-        # Abgeschlossene Achievements
-        completed = self.cursor.execute("""
-            SELECT a.name, a.description, a.reward
-            FROM user_achievements ua
-            JOIN achievements a ON ua.achievement_id = a.achievement_id
-            WHERE ua.user_id = ? AND ua.completed = TRUE
-        """, (user_id,)).fetchall()
-
-        # Offene Achievements
-        open_achievements = self.cursor.execute("""
-            SELECT a.name, a.description, a.reward
-            FROM achievements a
-            LEFT JOIN user_achievements ua ON a.achievement_id = ua.achievement_id AND ua.user_id = ?
-            WHERE ua.completed IS NULL OR ua.completed = FALSE
-        """, (user_id,)).fetchall()
-
-        response = "**Deine Achievements:**\n"
-        if completed:
-            response += "**Abgeschlossen:**\n"
-            for achievement in completed:
-                response += f"- **{achievement[0]}**: {achievement[1]} (Belohnung: {achievement[2]})\n"
-        else:
-            response += "Du hast noch keine Achievements abgeschlossen.\n"
+        async def count():
+            return (await state.db.fetchone("SELECT COUNT(*) FROM achievements WHERE guild_id = ?", (state.guild_id,)))[0]
 
-        if open_achievements:
-            response += "\n**Offen:**\n"
-            for achievement in open_achievements:
-                response += f"- **{achievement[0]}**: {achievement[1]} (Belohnung: {achievement[2]})\n"
-        else:
-            response += "\nDu hast alle Achievements abgeschlossen!"
+        total = await state.achievement_pages.get("count", count)
+        if not total:
+            await ctx.respond("Es gibt noch keine Achievements.")
+            return
 
-        await ctx.respond(response)
+        done = engine.completed_count(user_id)
+        if done >= total:
+            footer = f"Du hast alle {total} Achievements abgeschlossen!"
+        else:
+            footer = f"Abgeschlossen: {done} von {total}"
+
+        async def render(page):
+            # Die Liste ist für alle gleich, nur der Status kommt pro User aus dem Speicher
+            rows, has_next = await self._achievement_page(state, page)
+            lines = [
+                f"- {'✅' if engine.is_completed(user_id, achievement_id) else '⬜'} **{name}**: {description} (Belohnung: {reward})"
+                for achievement_id, name, description, reward in rows
+            ]
+            return render_page("Deine Achievements", lines, page, page_count(total), footer), has_next
+
+        await send_paginated(ctx, render)
+
+    @staticmethod
+    async def _achievement_page(state, page):
+        async def build():
+            rows = await state.db.fetchall("""
+                SELECT achievement_id, name, description, reward FROM achievements
+                WHERE guild_id = ? ORDER BY achievement_id LIMIT ? OFFSET ?
+            """, (state.guild_id, PER_PAGE + 1, page * PER_PAGE))
+            return rows[:PER_PAGE], len(rows) > PER_PAGE
+
+        # OFFSET kostet nur beim ersten Aufruf pro Seite, danach kommt sie aus dem Cache
+        return await state.achievement_pages.get(page, build)
 
     @discord.slash_command(name="weekly_challenges", description="Zeige deine wöchentlichen Herausforderungen an")
     async def weekly_challenges(self, ctx):
+        state = await self._guild_state(ctx)
+        if state is None:
+            return
+
         user_id = ctx.author.id
 
-        challenges = self.cursor.execute("""
-            SELECT wc.name, wc.description, wc.reward, uwp.progress
-            FROM weekly_challenges wc
-            LEFT JOIN user_weekly_progress uwp ON wc.challenge_id = uwp.challenge_id AND uwp.user_id = ?
-        """, (user_id,)).fetchall()
+        # Der Fortschritt ist pro User, daher kein Cache, aber immer nur eine Seite per Keyset
+        async def fetch(after, limit):
+            return await state.db.fetchall("""
+                SELECT wc.challenge_id, wc.name, wc.description, wc.reward, COALESCE(uwp.progress, 0)
+                FROM weekly_challenges wc
+                LEFT JOIN user_weekly_progress uwp
+                    ON wc.challenge_id = uwp.challenge_id AND uwp.guild_id = wc.guild_id AND uwp.user_id = ? AND uwp.week = ?
+                WHERE wc.guild_id = ? AND wc.challenge_id > ?
+                ORDER BY wc.challenge_id LIMIT ?
+            """, (user_id, state.challenges.week, state.guild_id, after, limit))
+
+        pages = KeysetPages(fetch)
+
+        async def render(page):
+            rows, has_next = await pages.get(page)
+            if not rows and page == 0:
+                return "Es gibt derzeit keine wöchentlichen Herausforderungen.", False
+            lines = []
+            for challenge_id, name, description, reward, progress in rows:
+                # Noch nicht geschriebenen Fortschritt mitzählen
+                progress += state.challenges.pending(user_id, challenge_id)
+                lines.append(f"- **{name}**: {description} (Fortschritt: {progress})")
+            return render_page("Wöchentliche Herausforderungen", lines, page), has_next
+
+        await send_paginated(ctx, render)
+    
+    @discord.slash_command(name="stats", description="Zeige Performance-Statistiken des Bots an")
+    @commands.has_permissions(administrator=True)
+    async def stats(self, ctx):
+        def line(name, histogram):
+            return (
+                f"- {name}: {histogram.count}x, "
+                f"p50 {histogram.quantile(0.5) * 1000:g} ms, "
+                f"p95 {histogram.quantile(0.95) * 1000:g} ms, "
+                f"p99 {histogram.quantile(0.99) * 1000:g} ms\n"
+            )
+
+        uptime = datetime.timedelta(seconds=int(time.time() - self.metrics.started))
+        response = f"**Statistiken** (seit {uptime}):\n\n**on_message:**\n"
+        for labels, histogram in sorted(self.metrics.histograms("celestix_on_message_seconds"), key=lambda item: item[0]["phase"]):
+            response += line(labels["phase"], histogram)
+
+        response += "\n**Befehle:**\n"
+        for labels, histogram in sorted(self.metrics.histograms("celestix_command_seconds"), key=lambda item: item[0]["command"]):
+            response += line(f"/{labels['command']}", histogram)
+
+        # Nur die teuersten Statements, sonst wird die Nachricht zu lang
+        response += "\n**SQL (Top 5 nach Gesamtzeit):**\n"
+        statements = sorted(self.metrics.histograms("celestix_sql_seconds"), key=lambda item: item[1].total, reverse=True)
+        for labels, histogram in statements[:5]:
+            response += line(f"`{labels['statement'][:60]}`", histogram)
+
+        lag = self.metrics.histograms("celestix_event_loop_lag_seconds")
+        if lag:
+            response += "\n**Event-Loop:**\n" + line("Verzögerung", lag[0][1])
+        states = self.guilds.states()
+        if self.process_index is not None:
+            response += f"\nProzess {self.process_index}, Shards {', '.join(map(str, self.bot.shard_ids))} von {self.bot.shard_count}"
+        response += (
+            f"\nGilden geladen: {len(states)}, Datenbanken: {len(self.guilds.storages())}\n"
+            f"Puffer: {sum(len(state.xp_buffer) for state in states)} XP, "
+            f"{sum(len(state.challenges) for state in states)} Herausforderungen, "
+            f"{sum(len(state.activity) for state in states)} Aktivität, "
+            f"{len(self.rewards)} Belohnungen in der Warteschlange"
+        )
+
+        await ctx.respond(response[:2000], ephemeral=True)
 
-        if not challenges:
-            await ctx.respond("Es gibt derzeit keine wöchentlichen Herausforderungen.")
+    @discord.slash_command(name="backup", description="Sichere die Datenbank sofort")
+    @commands.has_permissions(administrator=True)
+    async def backup(self, ctx):
+        if self.backups.running:
+            await ctx.respond("Es läuft bereits ein Backup.", ephemeral=True)
             return
 
-        response = "**Wöchentliche Herausforderungen:**\n"
-        for challenge in challenges:
-            name, description, reward, progress = challenge
-            response += f"- **{name}**: {description} (Fortschritt: {progress})\n"
+        await ctx.defer(ephemeral=True)
+        try:
+            reports = await self.run_backup()
+        except Exception as e:
+            await ctx.respond(f"Das Backup ist fehlgeschlagen: {e}"[:2000], ephemeral=True)
+            return
+        response = "**Backup abgeschlossen:**\n"
+        for report in reports:
+            response += f"- {os.path.basename(report['backup'])}: {report['bytes'] / 1024 / 1024:.1f} MB in {report['seconds']:.1f} s"
+            if "rows" in report:
+                response += f", Export mit {report['rows']} Zeilen"
+            response += "\n"
+        await ctx.respond(response[:2000], ephemeral=True)
 
-        await ctx.respond(response)
-    
     @discord.slash_command(name="add_achievement", description="Füge ein neues Achievement hinzu")
     @commands.has_permissions(administrator=True)
     async def add_achievement(self, ctx, name: str, description: str, condition: str, reward: str):
@@ -419,14 +974,42 @@ class XPSystem(commands.Cog):
     	:param condition: Die Bedingung, um das Achievement zu erfüllen (z. B. "level >= 25").
     	:param reward: Die Belohnung für das Achievement (z. B. "500 Coins").
     	"""
-    	# Füge das Achievement in die Datenbank ein
-    	self.cursor.execute("""
-    	    INSERT INTO achievements (name, description, condition, reward)
-    	    VALUES (?, ?, ?, ?)
-    	""", (name, description, condition, reward))
-    	self.conn.commit()
+    	state = await self._guild_state(ctx)
+    	if state is None:
+    	    return
+
+    	try:
+    	    branches = parse_condition(condition)
+    	except ValueError as e:
+    	    await ctx.respond(f"Das Achievement konnte nicht hinzugefügt werden. {e}")
+    	    return
+
+    	# Gepufferte XP zuerst schreiben, damit bestehende User korrekt nachgetragen werden
+    	await state.xp_buffer.flush()
+    	achievement_id, user_ids = await state.db.write(self._store_achievement, state.guild_id, name, description, condition, reward, branches)
+
+    	state.achievement_engine.add(achievement_id, condition)
+    	for user_id in user_ids:
+    	    state.achievement_engine.mark_completed(user_id, achievement_id)
+    	state.achievement_pages.clear()
 
     	await ctx.respond(f"Achievement **{name}** wurde hinzugefügt!")
 
+    @staticmethod
+    def _store_achievement(conn, guild_id, name, description, condition, reward, branches):
+        # Füge das Achievement in die Datenbank ein
+        achievement_id = conn.execute("""
+            INSERT INTO achievements (guild_id, name, description, condition, reward)
+            VALUES (?, ?, ?, ?, ?)
+        """, (guild_id, name, description, condition, reward)).lastrowid
+
+        # User der Gilde, die die Bedingung schon erfüllen, direkt nachtragen
+        user_ids = [row[0] for row in conn.execute(f"SELECT user_id FROM users WHERE guild_id = ? AND {condition_sql(branches)}", (guild_id,))]
+        conn.executemany(
+            "INSERT OR REPLACE INTO user_achievements (guild_id, user_id, achievement_id, completed) VALUES (?, ?, ?, TRUE)",
+            [(guild_id, user_id, achievement_id) for user_id in user_ids]
+        )
+        return achievement_id, user_ids
+
 def setup(bot):
     bot.add_cog(XPSystem(bot))
\ No newline at end of file
@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+
+from utils.achievements import MAX_BRANCHES, AchievementEngine, condition_sql, parse_condition
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ("level >= 25", [[("level", ">=", 25)]]),
+    ("level>=25", [[("level", ">=", 25)]]),
+    ("  prestige  ==  1  ", [[("prestige", "==", 1)]]),
+    ("level != -1", [[("level", "!=", -1)]]),
+    ("level >= 10 and prestige >= 1", [[("level", ">=", 10), ("prestige", ">=", 1)]]),
+    ("level >= 50 or prestige > 2", [[("level", ">=", 50)], [("prestige", ">", 2)]]),
+    ("(level < 5)", [[("level", "<", 5)]]),
+    (
+        "level >= 50 or (level >= 10 and prestige >= 1)",
+        [[("level", ">=", 50)], [("level", ">=", 10), ("prestige", ">=", 1)]],
+    ),
+    (
+        # "and" bindet stärker als "or"
+        "level >= 50 or level >= 10 and prestige <= 1",
+        [[("level", ">=", 50)], [("level", ">=", 10), ("prestige", "<=", 1)]],
+    ),
+    (
+        "(level >= 1 or prestige >= 1) and level < 90",
+        [[("level", ">=", 1), ("level", "<", 90)], [("prestige", ">=", 1), ("level", "<", 90)]],
+    ),
+])
+def test_parse_valid(condition, expected):
+    assert parse_condition(condition) == expected
+
+
+@pytest.mark.parametrize("condition", [
+    "",
+    "   ",
+    "level",
+    "level >=",
+    "level >= 1.5",
+    "level => 5",
+    "level = 5",
+    "coins >= 5",
+    "LEVEL >= 5",
+    "not level >= 5",
+    "level >= 5 and",
+    "level >= 5 or",
+    "and level >= 5",
+    "(level >= 5",
+    "level >= 5)",
+    "()",
+    "level >= 5 level >= 6",
+    "level >= 5 xor prestige >= 1",
+    "__import__('os').system('id')",
+    "level >= 5; DROP TABLE users",
+    "level >= 5 -- ",
+    "level >= 5 or 1 = 1",
+    "level >= (5)",
+])
+def test_parse_invalid(condition):
+    with pytest.raises(ValueError):
+        parse_condition(condition)
+
+
+def test_branch_cap():
+    # Jede Klammer verdoppelt die Zweige: 2 ** 6 liegt genau an der Grenze, 2 ** 7 darüber
+    pair = "(level >= 1 or prestige >= 1)"
+    assert len(parse_condition(" and ".join([pair] * 6))) == MAX_BRANCHES
+    with pytest.raises(ValueError):
+        parse_condition(" and ".join([pair] * 7))
+
+    chain = " or ".join(f"level >= {n}" for n in range(MAX_BRANCHES))
+    assert len(parse_condition(chain)) == MAX_BRANCHES
+    with pytest.raises(ValueError):
+        parse_condition(chain + " or level >= 1000")
+
+
+def test_condition_sql():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (user_id INTEGER, level INTEGER, prestige INTEGER)")
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?)", [(1, 60, 0), (2, 12, 1), (3, 12, 0), (4, 1, 5)])
+
+    def matching(condition):
+        sql = condition_sql(parse_condition(condition))
+        return [row[0] for row in conn.execute(f"SELECT user_id FROM users WHERE 1 = 0 OR {sql} ORDER BY user_id")]
+
+    assert matching("level >= 50 or (level >= 10 and prestige >= 1)") == [1, 2]
+    # Die Klammern um das Ergebnis schützen den Rest der WHERE-Klausel
+    assert matching("level >= 50 or level >= 10 and prestige >= 1") == [1, 2]
+    assert matching("(level >= 10 or prestige >= 5) and prestige < 1") == [1, 3]
+    assert matching("level == 2") == []
+
+
+def test_engine_or():
+    engine = AchievementEngine()
+    engine.load([(1, "level >= 50 or (level >= 10 and prestige >= 1)"), (2, "level > 3 and prestige >= 1")], [])
+
+    assert sorted(engine.evaluate(7, {"prestige": (0, 1)}, {"level": 12, "prestige": 1})) == [1, 2]
+    assert engine.evaluate(8, {"level": (49, 50)}, {"level": 50, "prestige": 0}) == [1]
+    assert engine.evaluate(9, {"level": (10, 11)}, {"level": 11, "prestige": 0}) == []
+    # Bereits erreicht: wird nicht noch einmal gemeldet
+    assert engine.evaluate(8, {"level": (50, 51)}, {"level": 51, "prestige": 0}) == []
+
+
+def test_engine_skips_invalid(capsys):
+    engine = AchievementEngine()
+    engine.load([(1, "level >= 5"), (2, "__import__('os')")], [])
+
+    assert "Achievement 2 wird ignoriert" in capsys.readouterr().out
+    assert engine.evaluate(1, {"level": (4, 5)}, {"level": 5, "prestige": 0}) == [1]
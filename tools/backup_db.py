@@ -0,0 +1,59 @@
+"""
+Backup, Export und Wiederherstellung der Celestix-Datenbanken von der Kommandozeile.
+
+Backup und Export funktionieren auch, während der Bot läuft. Ein Import legt immer
+eine neue Datei an; danach den Bot stoppen und die Datei an die Stelle der alten setzen.
+
+Beispiele::
+
+    python tools/backup_db.py backup database/celestix.db backups/celestix.db
+    python tools/backup_db.py export database/celestix.db celestix.jsonl.gz
+    python tools/backup_db.py import celestix.jsonl.gz database/celestix-restored.db
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.backup import backup_database, export_jsonl, import_jsonl  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup, Export und Import der Celestix-Datenbank")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup = commands.add_parser("backup", help="Online-Backup in eine SQLite-Datei")
+    backup.add_argument("database")
+    backup.add_argument("target")
+    backup.add_argument("--pages", type=int, default=256, help="Seiten pro Block")
+
+    export = commands.add_parser("export", help="Alle Tabellen als gzip-komprimiertes JSONL")
+    export.add_argument("database")
+    export.add_argument("target")
+
+    restore = commands.add_parser("import", help="Neue Datenbank aus einem JSONL-Export aufbauen")
+    restore.add_argument("source")
+    restore.add_argument("target")
+
+    args = parser.parse_args()
+    started = time.perf_counter()
+    if args.command == "backup":
+        restarts = backup_database(args.database, args.target, pages=args.pages)
+        print(f"{args.target}: {os.path.getsize(args.target) // 1024} KB, {restarts} Neustarts.")
+    elif args.command == "export":
+        counts = export_jsonl(args.database, args.target)
+        print(f"{args.target}: " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+    else:
+        try:
+            counts = import_jsonl(args.source, args.target)
+        except (FileExistsError, ValueError) as e:
+            raise SystemExit(str(e))
+        print(f"{args.target}: " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+    print(f"Fertig nach {time.perf_counter() - started:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
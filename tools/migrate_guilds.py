@@ -0,0 +1,107 @@
+"""
+Überführt eine Datenbank aus der Zeit vor den Gilden-Daten in das neue Schema.
+
+Bis Version 3 gab es nur einen gemeinsamen XP-Pool für alle Server. Die Migration auf
+Version 4 legt diese Zeilen in Gilde 0 ab; dieses Werkzeug ordnet sie einer echten Gilde
+zu und kann einzelne Gilden in eine eigene Datei auslagern (siehe ``dedicated_guilds``
+in der ``config.json``). Nur bei gestopptem Bot ausführen.
+
+Beispiel::
+
+    python tools/migrate_guilds.py --guild-id 123456789 --split 123456789
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.migrations import PARTITIONED_TABLES, migrate  # noqa: E402
+
+
+def open_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    applied = migrate(conn)
+    conn.commit()
+    if applied:
+        print(f"{path}: Migrationen {', '.join(map(str, applied))} angewendet.")
+    return conn
+
+
+def assign_legacy_rows(conn, guild_id):
+    """Ordnet alle Zeilen aus Gilde 0 der angegebenen Gilde zu. Gibt die Anzahl pro Tabelle zurück."""
+    moved = {}
+    try:
+        with conn:
+            for table in PARTITIONED_TABLES:
+                moved[table] = conn.execute(f"UPDATE {table} SET guild_id = ? WHERE guild_id = 0", (guild_id,)).rowcount
+    except sqlite3.IntegrityError:
+        # Passiert, wenn der Bot schon mit dem neuen Schema lief und dieselben User in der Gilde angelegt hat
+        raise SystemExit(
+            f"Gilde {guild_id} enthält bereits Daten, die mit den alten Zeilen kollidieren. "
+            f"Es wurde nichts geändert."
+        )
+    return moved
+
+
+def split_guild(conn, guild_id, directory):
+    """Verschiebt alle Zeilen einer Gilde in ``<directory>/<guild_id>.db``."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{guild_id}.db")
+    # Zieldatei mit demselben Schema anlegen bzw. auf den neuesten Stand bringen
+    open_database(path).close()
+
+    moved = {}
+    conn.execute("ATTACH DATABASE ? AS target", (path,))
+    try:
+        with conn:
+            for table in PARTITIONED_TABLES:
+                columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+                conn.execute(
+                    f"INSERT INTO target.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE guild_id = ?",
+                    (guild_id,)
+                )
+                moved[table] = conn.execute(f"DELETE FROM main.{table} WHERE guild_id = ?", (guild_id,)).rowcount
+            # Sonst würde der Bot den wöchentlichen Reset für die neue Datei neu beginnen
+            conn.execute("INSERT OR IGNORE INTO target.bot_state (key, value) SELECT key, value FROM main.bot_state")
+    except sqlite3.IntegrityError:
+        raise SystemExit(f"{path} enthält bereits Daten der Gilde {guild_id}. Es wurde nichts verschoben.")
+    finally:
+        conn.execute("DETACH DATABASE target")
+    return path, moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daten pro Gilde: alte Zeilen zuordnen und Gilden auslagern")
+    parser.add_argument("--database", default=os.path.join(ROOT, "database", "celestix.db"))
+    parser.add_argument("--guild-id", type=int, help="Gilde, der die bisherigen gemeinsamen Daten gehören")
+    parser.add_argument("--split", type=int, action="append", default=[], help="Gilde in eine eigene Datei verschieben (mehrfach möglich)")
+    parser.add_argument("--directory", default=os.path.join(ROOT, "database", "guilds"), help="Verzeichnis für ausgelagerte Gilden")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        raise SystemExit(f"{args.database} existiert nicht.")
+
+    conn = open_database(args.database)
+    legacy = sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE guild_id = 0").fetchone()[0] for table in PARTITIONED_TABLES)
+
+    if args.guild_id is not None:
+        moved = assign_legacy_rows(conn, args.guild_id)
+        print(f"Gilde {args.guild_id} zugeordnet: " + ", ".join(f"{table}={count}" for table, count in moved.items()))
+    elif legacy:
+        print(f"{legacy} Zeilen gehören noch keiner Gilde. Mit --guild-id zuordnen, sonst sieht der Bot sie nicht.")
+
+    for guild_id in args.split:
+        path, moved = split_guild(conn, guild_id, args.directory)
+        print(f"Gilde {guild_id} nach {path} verschoben: " + ", ".join(f"{table}={count}" for table, count in moved.items()))
+
+    if args.split:
+        print(f'Jetzt in der config.json unter "xp_system" eintragen: "dedicated_guilds": {args.split}')
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import bisect
+import operator
+import re
+
+
+# Werte, auf die sich eine Bedingung beziehen darf
+STATS = ("level", "prestige")
+
+OPERATORS = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Mehr Oder-Zweige entstehen nur aus absurd verschachtelten Bedingungen
+MAX_BRANCHES = 64
+
+# Token-Arten entsprechen den Gruppen von _TOKEN
+_OPEN, _CLOSE, _OPERATOR, _NUMBER, _WORD = range(1, 6)
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|(>=|<=|==|!=|>|<)|(-?\d+)|([A-Za-z_]+))")
+
+
+def _tokenize(condition):
+    tokens = []
+    position = 0
+    condition = condition.rstrip()
+    while position < len(condition):
+        match = _TOKEN.match(condition, position)
+        if not match:
+            raise ValueError(f"Ungültige Bedingung: {condition[position:].strip()!r}")
+        kind = match.lastindex
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    # Grammatik: oder := und ("or" und)* ; und := term ("and" term)* ; term := "(" oder ")" | stat op zahl
+    # Ergebnis ist immer eine Oder-Liste von Und-Listen, Klammern werden dabei ausmultipliziert.
+
+    def __init__(self, condition):
+        self.tokens = _tokenize(condition)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else None
+
+    def next(self, kind, expected):
+        if self.position >= len(self.tokens) or self.tokens[self.position][0] != kind:
+            found = self.peek()
+            raise ValueError(f"{expected} erwartet, gefunden: {'Ende' if found is None else repr(found)}")
+        self.position += 1
+        return self.tokens[self.position - 1][1]
+
+    def parse(self):
+        branches = self.any_of()
+        if self.peek() is not None:
+            raise ValueError(f"Unerwartet: {self.peek()!r}")
+        return branches
+
+    def any_of(self):
+        branches = self.all_of()
+        while self.peek() == "or":
+            self.position += 1
+            branches = branches + self.all_of()
+            if len(branches) > MAX_BRANCHES:
+                raise ValueError("Die Bedingung ist zu verschachtelt.")
+        return branches
+
+    def all_of(self):
+        branches = self.term()
+        while self.peek() == "and":
+            self.position += 1
+            right = self.term()
+            if len(branches) * len(right) > MAX_BRANCHES:
+                raise ValueError("Die Bedingung ist zu verschachtelt.")
+            branches = [left + other for left in branches for other in right]
+        return branches
+
+    def term(self):
+        if self.peek() == "(":
+            self.position += 1
+            branches = self.any_of()
+            self.next(_CLOSE, "')'")
+            return branches
+        stat = self.next(_WORD, "Wert")
+        if stat not in STATS:
+            raise ValueError(f"Unbekannter Wert: {stat!r}")
+        op = self.next(_OPERATOR, "Vergleich")
+        value = int(self.next(_NUMBER, "Zahl"))
+        return [[(stat, op, value)]]
+
+
+def parse_condition(condition):
+    """
+    Zerlegt eine Bedingung wie ``"level >= 25"`` oder
+    ``"(level >= 10 and prestige >= 1) or level >= 50"`` in eine Oder-Liste von Und-Listen
+    aus ``(stat, operator, wert)``. Es wird nichts ausgeführt, ungültige Bedingungen lösen
+    einen ``ValueError`` aus.
+    """
+    return _Parser(condition).parse()
+
+
+def condition_sql(branches):
+    """Baut aus einer geparsten Bedingung eine WHERE-Klausel für die Tabelle ``users``."""
+    # stat und op stammen aus den Whitelists oben, der Wert ist bereits ein int
+    return "(" + " OR ".join(
+        "(" + " AND ".join(f"{stat} {op} {value}" for stat, op, value in clauses) + ")"
+        for clauses in branches
+    ) + ")"
+
+
+class AchievementEngine:
+    """
+    Wertet Achievements anhand vorkompilierter Bedingungen aus.
+
+    Vergleiche der Form ``stat >= n`` (bzw. ``>``) aus allen Oder-Zweigen werden pro Stat
+    nach Schwelle sortiert abgelegt. Ändert sich ein Stat von ``alt`` auf ``neu``, werden per
+    Binärsuche nur die Regeln geprüft, deren Schwelle in diesem Intervall liegt. Alle anderen
+    Vergleiche werden nur geprüft, wenn sich ihr Stat überhaupt geändert hat. Bereits
+    abgeschlossene Achievements werden im Speicher gehalten und nie erneut geschrieben.
+    """
+
+    def __init__(self):
+        self._rules = {}  # achievement_id -> Oder-Liste von Klauseln
+        self._thresholds = {stat: ([], []) for stat in STATS}  # stat -> (Schwellen, achievement_ids)
+        self._other = {stat: set() for stat in STATS}
+        self._completed = {}  # user_id -> set(achievement_id)
+
+    def add(self, achievement_id, condition):
+        branches = parse_condition(condition)
+        self._rules[achievement_id] = branches
+        for stat, op, value in {clause for clauses in branches for clause in clauses}:
+            if op in (">=", ">"):
+                threshold = value if op == ">=" else value + 1
+                keys, ids = self._thresholds[stat]
+                index = bisect.bisect_right(keys, threshold)
+                keys.insert(index, threshold)
+                ids.insert(index, achievement_id)
+            else:
+                self._other[stat].add(achievement_id)
+        return branches
+
+    def load(self, achievements, completed):
+        """
+        :param achievements: Zeilen ``(achievement_id, condition)``.
+        :param completed: Zeilen ``(user_id, achievement_id)`` bereits abgeschlossener Achievements.
+        """
+        for achievement_id, condition in achievements:
+            try:
+                self.add(achievement_id, condition)
+            except ValueError as e:
+                print(f"Achievement {achievement_id} wird ignoriert, Bedingung {condition!r} ist ungültig: {e}")
+        for user_id, achievement_id in completed:
+            self.mark_completed(user_id, achievement_id)
+
+    def mark_completed(self, user_id, achievement_id):
+        self._completed.setdefault(user_id, set()).add(achievement_id)
+
+    def is_completed(self, user_id, achievement_id):
+        return achievement_id in self._completed.get(user_id, ())
+
+    def completed_count(self, user_id):
+        return len(self._completed.get(user_id, ()))
+
+    def candidates(self, user_id, changed):
+        """
+        Gibt die Achievements zurück, die durch die Änderung erfüllt sein könnten.
+
+        :param changed: ``{stat: (alt, neu)}``
+        """
+        result = set()
+        for stat, (old, new) in changed.items():
+            if old == new:
+                continue
+            if new > old:
+                keys, ids = self._thresholds[stat]
+                # Schwelle überschritten: alt < schwelle <= neu
+                result.update(ids[bisect.bisect_right(keys, old):bisect.bisect_right(keys, new)])
+            result.update(self._other[stat])
+        done = self._completed.get(user_id)
+        if done:
+            result -= done
+        return result
+
+    def evaluate(self, user_id, changed, stats):
+        """
+        Prüft die betroffenen Regeln gegen die aktuellen Werte und gibt neu erfüllte
+        Achievements zurück. Diese werden direkt als abgeschlossen markiert.
+        """
+        unlocked = []
+        for achievement_id in self.candidates(user_id, changed):
+            branches = self._rules[achievement_id]
+            if any(all(OPERATORS[op](stats[stat], value) for stat, op, value in clauses) for clauses in branches):
+                self.mark_completed(user_id, achievement_id)
+                unlocked.append(achievement_id)
+        return unlocked
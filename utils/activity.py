@@ -0,0 +1,233 @@
+import time
+
+
+# Zeiträume für /activity: Name -> (Titel, Tage). "tag" zählt stundengenau die letzten 24 Stunden
+PERIODS = {
+    "tag": ("Letzte 24 Stunden", 1),
+    "woche": ("Letzte 7 Tage", 7),
+    "monat": ("Letzte 30 Tage", 30),
+}
+
+# So lange nach Tagesende dürfen gepufferte Einträge noch eintreffen, bevor der Tag zusammengefasst wird
+GRACE_HOURS = 1
+
+# Balken für den Verlauf in /rank, vom kleinsten zum größten Wert
+BARS = "▁▂▃▄▅▆▇█"
+
+_COMPACTED_KEY = "activity_compacted"
+
+
+def current_hour(now=None):
+    """Stunden-Bucket (Unix-Zeit // 3600) für ``now`` bzw. jetzt."""
+    return int(time.time() if now is None else now) // 3600
+
+
+def window_start(days, now=None):
+    """Erste Stunde eines Zeitraums: bei einem Tag die letzten 24 Stunden, sonst ganze Tage inklusive heute."""
+    hour = current_hour(now)
+    if days == 1:
+        return hour - 23
+    return (hour // 24 - days + 1) * 24
+
+
+def sparkline(values):
+    peak = max(values, default=0)
+    if not peak:
+        return BARS[0] * len(values)
+    return "".join(BARS[round(value / peak * (len(BARS) - 1))] for value in values)
+
+
+def compacted_day(conn):
+    """Letzter Tag, der schon in ``activity_daily`` steht, oder ``-1``."""
+    row = conn.execute("SELECT value FROM bot_state WHERE key = ?", (_COMPACTED_KEY,)).fetchone()
+    return int(row[0]) if row else -1
+
+
+def load_activity_ranking(conn, guild_id, start_hour, limit):
+    """
+    Rangliste nach XP ab ``start_hour`` als Zeilen ``(user_id, nachrichten, xp)``.
+
+    Zusammengefasste Tage kommen aus ``activity_daily``, alles danach aus ``activity_hourly``;
+    beides sind Bereichs-Scans über den Primärschlüssel der Gilde. Liegt ``start_hour`` nicht
+    auf einem Tagesanfang, wird nur stündlich gezählt (die Stunden-Buckets reichen immer
+    mindestens zwei Tage zurück).
+    """
+    if start_hour % 24:
+        first_day, last_day, split = 0, -1, start_hour
+    else:
+        last_day = compacted_day(conn)
+        first_day, split = start_hour // 24, max(start_hour, (last_day + 1) * 24)
+    return conn.execute("""
+        SELECT user_id, SUM(messages), SUM(xp) AS total FROM (
+            SELECT user_id, messages, xp FROM activity_daily WHERE guild_id = ?1 AND day >= ?2 AND day <= ?3
+            UNION ALL
+            SELECT user_id, messages, xp FROM activity_hourly WHERE guild_id = ?1 AND hour >= ?4
+        )
+        GROUP BY user_id
+        ORDER BY total DESC, user_id
+        LIMIT ?5
+    """, (guild_id, first_day, last_day, split, limit)).fetchall()
+
+
+def load_activity_history(conn, guild_id, user_id, start_day):
+    """XP eines Users pro Tag ab ``start_day`` als ``{tag: xp}``."""
+    last_day = compacted_day(conn)
+    history = dict(conn.execute(
+        "SELECT day, xp FROM activity_daily WHERE guild_id = ? AND user_id = ? AND day >= ? AND day <= ?",
+        (guild_id, user_id, start_day, last_day)
+    ))
+    hours = conn.execute("""
+        SELECT hour / 24, SUM(xp) FROM activity_hourly
+        WHERE guild_id = ? AND hour >= ? AND user_id = ?
+        GROUP BY hour / 24
+    """, (guild_id, max(start_day, last_day + 1) * 24, user_id))
+    for day, xp in hours:
+        history[day] = history.get(day, 0) + xp
+    return history
+
+
+def _next_guild(conn, table, after):
+    # Ein Seek pro Gilde statt eines Scans über die ganze Tabelle
+    row = conn.execute(f"SELECT guild_id FROM {table} WHERE guild_id > ? ORDER BY guild_id LIMIT 1", (after,)).fetchone()
+    return row[0] if row else None
+
+
+def _first_hour(conn):
+    return conn.execute("SELECT MIN(hour) FROM activity_hourly").fetchone()[0]
+
+
+def _set_compacted(conn, day):
+    conn.execute(
+        "INSERT INTO bot_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (_COMPACTED_KEY, str(day))
+    )
+
+
+def _roll_day(conn, guild_id, day):
+    # REPLACE statt Addieren: nach einer Unterbrechung kann derselbe Tag gefahrlos erneut zusammengefasst werden
+    conn.execute("""
+        INSERT OR REPLACE INTO activity_daily (guild_id, day, user_id, messages, xp)
+        SELECT ?1, ?2, user_id, SUM(messages), SUM(xp) FROM activity_hourly
+        WHERE guild_id = ?1 AND hour >= ?3 AND hour < ?4
+        GROUP BY user_id
+    """, (guild_id, day, day * 24, day * 24 + 24))
+
+
+def _prune(conn, table, column, guild_id, before):
+    return conn.execute(f"DELETE FROM {table} WHERE guild_id = ? AND {column} < ?", (guild_id, before)).rowcount
+
+
+async def _guilds(db, table):
+    guild_id = -1
+    while True:
+        guild_id = await db.read(_next_guild, table, guild_id)
+        if guild_id is None:
+            return
+        yield guild_id
+
+
+async def compact(db, hourly_days=2, daily_days=400, now=None):
+    """
+    Fasst abgeschlossene Tage zusammen und löscht, was älter als die Aufbewahrungszeit ist.
+
+    Jeder Tag wird pro Gilde in einer eigenen kurzen Transaktion von ``activity_hourly`` nach
+    ``activity_daily`` übertragen; welcher Tag zuletzt fertig wurde, steht in ``bot_state``.
+    Stunden-Buckets bleiben ``hourly_days`` Tage, Tages-Buckets ``daily_days`` Tage erhalten,
+    der Speicher wächst also nicht mit der Laufzeit.
+
+    :return: ``(zusammengefasste Tage, gelöschte Zeilen)``.
+    """
+    hour = current_hour(now)
+    today = hour // 24
+    last_day = (hour - GRACE_HOURS) // 24 - 1
+    done = await db.read(compacted_day)
+    if done < 0:
+        # Erster Lauf: ab dem ältesten vorhandenen Bucket
+        first = await db.read(_first_hour)
+        done = first // 24 - 1 if first is not None else last_day
+        await db.write(_set_compacted, done)
+
+    rolled = 0
+    for day in range(done + 1, last_day + 1):
+        async for guild_id in _guilds(db, "activity_hourly"):
+            await db.write(_roll_day, guild_id, day)
+        await db.write(_set_compacted, day)
+        done = day
+        rolled += 1
+    if not rolled:
+        return 0, 0
+
+    # Noch nicht zusammengefasste Stunden bleiben in jedem Fall erhalten
+    hourly_before = min(today - hourly_days + 1, done + 1) * 24
+    daily_before = today - daily_days + 1
+    deleted = 0
+    async for guild_id in _guilds(db, "activity_hourly"):
+        deleted += await db.write(_prune, "activity_hourly", "hour", guild_id, hourly_before)
+    async for guild_id in _guilds(db, "activity_daily"):
+        deleted += await db.write(_prune, "activity_daily", "day", guild_id, daily_before)
+    return rolled, deleted
+
+
+class ActivityTracker:
+    """
+    Zählt Nachrichten und XP pro User und Stunde im Speicher.
+
+    Geschrieben wird gesammelt mit einem einzigen Upsert pro Flush in ``activity_hourly``,
+    zu Tagen zusammengefasst später von :func:`compact`.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self._pending = {}  # (user_id, stunde) -> [nachrichten, xp]
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, xp, now=None):
+        key = (user_id, current_hour(now))
+        counts = self._pending.get(key)
+        if counts is None:
+            self._pending[key] = [1, xp]
+        else:
+            counts[0] += 1
+            counts[1] += xp
+
+    def pending(self, user_id):
+        """Noch nicht geschriebene XP eines Users als ``{stunde: xp}``."""
+        return {hour: counts[1] for (pending_user, hour), counts in self._pending.items() if pending_user == user_id}
+
+    def take(self):
+        pending, self._pending = self._pending, {}
+        return [(self.guild_id, hour, user_id, messages, xp) for (user_id, hour), (messages, xp) in pending.items()]
+
+    def restore(self, rows):
+        for _, hour, user_id, messages, xp in rows:
+            counts = self._pending.setdefault((user_id, hour), [0, 0])
+            counts[0] += messages
+            counts[1] += xp
+
+    @staticmethod
+    def write(conn, rows):
+        conn.executemany("""
+            INSERT INTO activity_hourly (guild_id, hour, user_id, messages, xp) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(guild_id, hour, user_id) DO UPDATE SET
+                messages = messages + excluded.messages,
+                xp = xp + excluded.xp
+        """, rows)
+
+    async def flush(self, db):
+        rows = self.take()
+        if not rows:
+            return 0
+        try:
+            await db.write(self.write, rows)
+        except Exception:
+            self.restore(rows)
+            raise
+        return len(rows)
+
+    def flush_sync(self, db):
+        rows = self.take()
+        if rows:
+            db.write_sync(self.write, rows)
+        return len(rows)
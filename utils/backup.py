@@ -0,0 +1,250 @@
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import re
+import sqlite3
+import time
+
+from utils.migrations import LATEST, current_version, migrate
+
+
+EXPORT_FORMAT = "celestix-jsonl"
+EXPORT_VERSION = 1
+
+# Legt migrate() beim Import selbst an, werden also nicht übernommen
+_SKIP_TABLES = {"schema_version", "sqlite_sequence"}
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def backup_database(source, target, pages=256, sleep=0.005, max_restarts=3):
+    """
+    Kopiert eine laufende Datenbank blockweise mit der Online-Backup-API von SQLite.
+
+    Zwischen zwei Blöcken von ``pages`` Seiten wird die Sperre freigegeben, der Bot kann
+    also weiter lesen und schreiben. Schreibt eine andere Verbindung dazwischen, beginnt
+    SQLite die Kopie von vorn; passiert das öfter als ``max_restarts``-mal, wird in einem
+    einzigen Schritt kopiert. Im WAL-Modus hält auch das nur einen Lese-Snapshot und
+    blockiert keine Schreiber.
+
+    Die Kopie entsteht unter einem temporären Namen, ein abgebrochenes Backup hinterlässt
+    also nie eine halbe Datei unter dem endgültigen Namen.
+
+    :return: Die Anzahl der Neustarts.
+    """
+    tmp = f"{target}.tmp"
+    seen = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if seen["remaining"] is not None and remaining > seen["remaining"]:
+            seen["restarts"] += 1
+            if seen["restarts"] > max_restarts:
+                raise _TooManyRestarts()
+        seen["remaining"] = remaining
+
+    src = sqlite3.connect(source)
+    try:
+        src.execute("PRAGMA query_only=1")
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            dst.close()
+            os.remove(tmp)
+            dst = sqlite3.connect(tmp)
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(tmp, target)
+    return seen["restarts"]
+
+
+def export_jsonl(source, target):
+    """
+    Schreibt alle Tabellen zeilenweise als gzip-komprimiertes JSONL.
+
+    Die erste Zeile ist ein Kopf mit Format- und Schemaversion. Danach folgt pro Tabelle
+    ein Objekt ``{"table": ..., "columns": [...]}`` und für jede Zeile eine JSON-Liste.
+    Gelesen wird in einer einzigen Lesetransaktion, die Tabellen werden dabei nie ganz
+    in den Speicher geladen.
+
+    :return: Die Anzahl der Zeilen pro Tabelle.
+    """
+    tmp = f"{target}.tmp"
+    counts = {}
+    conn = sqlite3.connect(source)
+    try:
+        conn.execute("PRAGMA query_only=1")
+        conn.execute("BEGIN")
+        header = {
+            "format": EXPORT_FORMAT,
+            "version": EXPORT_VERSION,
+            "schema_version": current_version(conn),
+            "created": datetime.datetime.now().isoformat(),
+        }
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for table in tables:
+                cursor = conn.execute(f'SELECT * FROM "{table}"')
+                f.write(json.dumps({"table": table, "columns": [column[0] for column in cursor.description]}) + "\n")
+                count = 0
+                for row in cursor:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    count += 1
+                counts[table] = count
+    finally:
+        conn.close()
+    os.replace(tmp, target)
+    return counts
+
+
+def import_jsonl(source, target, batch_size=1000):
+    """
+    Baut aus einem Export von :func:`export_jsonl` eine neue Datenbank auf.
+
+    Das Schema legt :func:`utils.migrations.migrate` an, danach werden die Zeilen blockweise
+    eingefügt. Die Zieldatei darf noch nicht existieren.
+
+    :return: Die Anzahl der Zeilen pro Tabelle.
+    """
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} existiert bereits.")
+
+    tmp = f"{target}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    counts = {}
+    conn = sqlite3.connect(tmp)
+    try:
+        with gzip.open(source, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != EXPORT_FORMAT or header.get("version") != EXPORT_VERSION:
+                raise ValueError(f"{source} ist kein Celestix-Export.")
+            if header.get("schema_version", 0) > LATEST:
+                raise ValueError(f"Der Export hat Schemaversion {header['schema_version']}, unterstützt wird bis {LATEST}.")
+
+            migrate(conn)
+            insert, table, batch = None, None, []
+            for line in f:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    if batch:
+                        conn.executemany(insert, batch)
+                        batch = []
+                    table = record["table"]
+                    if table in _SKIP_TABLES:
+                        insert = None
+                        continue
+                    columns = ", ".join(f'"{column}"' for column in record["columns"])
+                    placeholders = ", ".join("?" * len(record["columns"]))
+                    insert = f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})'
+                    counts[table] = 0
+                elif insert is not None:
+                    batch.append(record)
+                    counts[table] += 1
+                    if len(batch) >= batch_size:
+                        conn.executemany(insert, batch)
+                        batch = []
+            if batch:
+                conn.executemany(insert, batch)
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp)
+        raise
+    conn.close()
+    os.replace(tmp, target)
+    return counts
+
+
+def rotate(directory, stem, suffix, keep):
+    """
+    Löscht bis auf die ``keep`` neuesten Dateien ``<stem>-<zeitstempel><suffix>``.
+
+    :return: Die gelöschten Pfade.
+    """
+    pattern = re.compile(rf"^{re.escape(stem)}-\d{{8}}-\d{{6}}{re.escape(suffix)}$")
+    # Der Zeitstempel sortiert sich lexikografisch richtig
+    files = sorted(name for name in os.listdir(directory) if pattern.match(name))
+    removed = []
+    for name in files[:-keep] if keep > 0 else []:
+        path = os.path.join(directory, name)
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+class BackupManager:
+    """
+    Sichert alle Datenbanken des Bots in ein Verzeichnis und hält nur die neuesten ``keep``.
+
+    Pro Datenbank entstehen ``<name>-<zeitstempel>.db`` (Online-Backup) und, falls aktiviert,
+    ``<name>-<zeitstempel>.jsonl.gz``. Der Export wird aus der fertigen Kopie erzeugt und
+    belastet die laufende Datenbank daher nicht zusätzlich. Alles läuft in einem Worker-Thread.
+    """
+
+    def __init__(self, directory="database/backups", keep=7, pages=256, sleep=0.005, export=True):
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.sleep = sleep
+        self.export = export
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls(
+            directory=settings.get("directory", "database/backups"),
+            keep=settings.get("keep", 7),
+            pages=settings.get("pages", 256),
+            sleep=settings.get("sleep", 0.005),
+            export=settings.get("export", True),
+        )
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def last_backup(self):
+        """Zeitpunkt (Unix-Zeit) des neuesten Backups oder ``None``."""
+        if not os.path.isdir(self.directory):
+            return None
+        times = [entry.stat().st_mtime for entry in os.scandir(self.directory) if entry.name.endswith(".db")]
+        return max(times, default=None)
+
+    async def run(self, paths):
+        """Sichert die angegebenen Datenbanken nacheinander. Gibt pro Datenbank einen Bericht zurück."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._run, list(paths))
+
+    def _run(self, paths):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        reports = []
+        for path in paths:
+            started = time.perf_counter()
+            stem = os.path.splitext(os.path.basename(path))[0]
+            target = os.path.join(self.directory, f"{stem}-{stamp}.db")
+            report = {
+                "database": path,
+                "backup": target,
+                "restarts": backup_database(path, target, self.pages, self.sleep),
+                "bytes": os.path.getsize(target),
+            }
+            rotate(self.directory, stem, ".db", self.keep)
+            if self.export:
+                export = os.path.join(self.directory, f"{stem}-{stamp}.jsonl.gz")
+                report["rows"] = sum(export_jsonl(target, export).values())
+                report["export"] = export
+                rotate(self.directory, stem, ".jsonl.gz", self.keep)
+            report["seconds"] = time.perf_counter() - started
+            reports.append(report)
+        return reports
@@ -0,0 +1,105 @@
+import datetime
+import re
+
+
+# Ereignisse, auf die eine Herausforderung hören kann (z. B. "messages >= 100")
+EVENTS = ("messages", "level_ups", "purchases")
+
+_CONDITION = re.compile(r"^\s*([a-z_]+)\s*(?:>=|>|==)\s*(\d+)\s*$")
+
+
+def current_week():
+    """Die aktuelle Kalenderwoche (ISO, UTC) wie ``"2026-42"``; als Text sortiert sie richtig."""
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%G-%V")
+
+
+def classify(condition):
+    """Gibt das Ereignis zurück, das eine Bedingung zählt, oder ``None``."""
+    match = _CONDITION.match(condition or "")
+    if not match or match.group(1) not in EVENTS:
+        return None
+    return match.group(1)
+
+
+class ChallengeTracker:
+    """
+    Zählt den Fortschritt der wöchentlichen Herausforderungen im Speicher.
+
+    Herausforderungen werden beim Laden nach Ereignis einsortiert. Ein Ereignis erhöht
+    nur die Zähler der Herausforderungen, die darauf hören; geschrieben wird gesammelt
+    mit einem einzigen Upsert pro Flush. Jede Zeile trägt die Woche, in der gezählt wurde,
+    damit das Zurücksetzen nur Fortschritt älterer Wochen löscht.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.week = current_week()
+        self._by_event = {event: () for event in EVENTS}
+        self._pending = {}  # (user_id, challenge_id) -> Zuwachs
+
+    def load(self, challenges):
+        """:param challenges: Zeilen ``(challenge_id, condition)``."""
+        by_event = {event: [] for event in EVENTS}
+        for challenge_id, condition in challenges:
+            event = classify(condition)
+            if event:
+                by_event[event].append(challenge_id)
+        self._by_event = {event: tuple(ids) for event, ids in by_event.items()}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, event, amount=1):
+        for challenge_id in self._by_event[event]:
+            key = (user_id, challenge_id)
+            self._pending[key] = self._pending.get(key, 0) + amount
+
+    def pending(self, user_id, challenge_id):
+        return self._pending.get((user_id, challenge_id), 0)
+
+    def take(self):
+        pending, self._pending = self._pending, {}
+        return [(self.guild_id, user_id, challenge_id, amount, self.week) for (user_id, challenge_id), amount in pending.items()]
+
+    def restore(self, rows):
+        for _, user_id, challenge_id, amount, week in rows:
+            if week != self.week:
+                continue  # Inzwischen hat eine neue Woche begonnen
+            key = (user_id, challenge_id)
+            self._pending[key] = self._pending.get(key, 0) + amount
+
+    def start_week(self, week):
+        """Verwirft den Fortschritt der alten Woche, alles Weitere zählt für ``week``."""
+        self._pending.clear()
+        self.week = week
+
+    @staticmethod
+    def write(conn, rows):
+        # Eine neuere Woche ersetzt den alten Stand, verspätete Zeilen einer älteren Woche ändern nichts
+        conn.executemany("""
+            INSERT INTO user_weekly_progress (guild_id, user_id, challenge_id, progress, week) VALUES (?1, ?2, ?3, ?4, ?5)
+            ON CONFLICT(guild_id, user_id, challenge_id) DO UPDATE SET
+                progress = CASE
+                    WHEN week = ?5 THEN progress + ?4
+                    WHEN week IS NULL OR week < ?5 THEN ?4
+                    ELSE progress
+                END,
+                week = CASE WHEN week IS NULL OR week < ?5 THEN ?5 ELSE week END
+        """, rows)
+
+    async def flush(self, db):
+        rows = self.take()
+        if not rows:
+            return 0
+        try:
+            await db.write(self.write, rows)
+        except Exception:
+            self.restore(rows)
+            raise
+        return len(rows)
+
+    def flush_sync(self, db):
+        rows = self.take()
+        if rows:
+            db.write_sync(self.write, rows)
+        return len(rows)
@@ -0,0 +1,246 @@
+import asyncio
+import datetime
+import os
+
+from utils.achievements import AchievementEngine
+from utils.activity import ActivityTracker
+from utils.challenges import ChallengeTracker
+from utils.leaderboard import Ranking
+from utils.migrations import migrate, unassigned_warning
+from utils.pagination import PageCache
+from utils.season import ROLLOVER_CHUNK, SeasonState, archive_chunk, open_next_season, reset_chunk
+from utils.shop import ShopCatalog
+from utils.storage import Storage
+from utils.storage_service import RemoteStorage
+from utils.xp_buffer import XPBuffer
+
+
+def load_achievements(conn, guild_id):
+    achievements = conn.execute("SELECT achievement_id, condition FROM achievements WHERE guild_id = ?", (guild_id,)).fetchall()
+    completed = conn.execute(
+        "SELECT user_id, achievement_id FROM user_achievements WHERE guild_id = ? AND completed = TRUE", (guild_id,)
+    ).fetchall()
+    return achievements, completed
+
+
+def load_ranking(conn, guild_id):
+    return conn.execute(
+        "SELECT user_id, level, prestige FROM users WHERE guild_id = ? ORDER BY level DESC, prestige DESC", (guild_id,)
+    ).fetchall()
+
+
+def load_rewards(conn, guild_id):
+    rows = conn.execute("SELECT level, reward_type, reward_value FROM rewards WHERE guild_id = ?", (guild_id,))
+    return [(level, (reward_type, reward_value)) for level, reward_type, reward_value in rows]
+
+
+def load_challenges(conn, guild_id):
+    return conn.execute("SELECT challenge_id, condition FROM weekly_challenges WHERE guild_id = ?", (guild_id,)).fetchall()
+
+
+def database_paths(path, dedicated=(), directory="database/guilds"):
+    """Gibt ``{guild_id: pfad}`` für alle Datenbankdateien zurück, die gemeinsame unter ``None``."""
+    paths = {None: path}
+    for guild_id in dedicated:
+        paths[int(guild_id)] = os.path.join(directory, f"{int(guild_id)}.db")
+    return paths
+
+
+class GuildState:
+    """
+    Alle zwischengespeicherten Daten einer Gilde: XP-Puffer, Season, Achievements,
+    Herausforderungen, Aktivität, Rangliste, Level-Belohnungen und Shop.
+
+    Gilden teilen sich nichts außer der Datenbankdatei, und auch die nur, wenn sie
+    nicht in eine eigene Datei ausgelagert wurden (siehe :class:`GuildRegistry`).
+    """
+
+    def __init__(self, guild_id, db, flush_size=500):
+        self.guild_id = guild_id
+        self.db = db
+        self.xp_buffer = XPBuffer(db, guild_id, flush_size=flush_size)
+        self.season = SeasonState(guild_id)
+        self.achievement_engine = AchievementEngine()
+        self.challenges = ChallengeTracker(guild_id)
+        self.activity = ActivityTracker(guild_id)
+        self.ranking = Ranking()
+        self.shop_catalog = ShopCatalog(guild_id)
+        self.reward_map = {}
+        # User, deren Level-Belohnungen seit dem Start schon abgeglichen wurden
+        self.rewards_checked = set()
+        # Gerenderte Seiten, die für alle gleich sind; die Admin-Befehle leeren sie
+        self.shop_pages = PageCache()
+        self.achievement_pages = PageCache()
+        # Ranglisten aus /activity: zeitraum -> (gültig bis, zeilen)
+        self.activity_boards = {}
+        self.rollover_lock = asyncio.Lock()
+
+    @staticmethod
+    def _fetch(conn, guild_id):
+        return (
+            SeasonState.fetch(conn, guild_id),
+            load_achievements(conn, guild_id),
+            load_challenges(conn, guild_id),
+            load_ranking(conn, guild_id),
+            load_rewards(conn, guild_id),
+            ShopCatalog.fetch(conn, guild_id),
+        )
+
+    async def load(self):
+        # Ein einziger Lesezugriff für alles, damit die erste Nachricht einer Gilde nicht mehrfach wartet
+        season, achievements, challenges, ranking, rewards, shop = await self.db.read(self._fetch, self.guild_id)
+        self.season.set(season)
+        self.achievement_engine.load(*achievements)
+        self.challenges.load(challenges)
+        self.ranking.load(ranking)
+        self.reward_map = dict(rewards)
+        self.shop_catalog.set(shop)
+        self.shop_pages.clear()
+        self.achievement_pages.clear()
+
+    async def flush(self):
+        # Jeder Puffer für sich: schlägt einer fehl, werden die anderen trotzdem geschrieben.
+        # Die Deltas des fehlgeschlagenen bleiben im Puffer, der erste Fehler wird weitergereicht
+        error = None
+        for flush in (self.xp_buffer.flush(), self.challenges.flush(self.db), self.activity.flush(self.db)):
+            try:
+                await flush
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def flush_sync(self):
+        self.xp_buffer.flush_sync()
+        self.challenges.flush_sync(self.db)
+        self.activity.flush_sync(self.db)
+
+    async def rollover(self, season_id, next_days=None):
+        """
+        Archiviert die Endstände einer Season, setzt XP und Level zurück und startet die nächste.
+
+        Jeder Block ist eine eigene kurze Transaktion im Writer-Thread, XP-Flushes und Befehle
+        anderer Gilden kommen also zwischendurch weiter dran. Der Fortschritt steht im Status
+        der Season (``archiving``, dann ``resetting``), ein unterbrochener Wechsel wird beim
+        nächsten Aufruf an derselben Stelle fortgesetzt.
+
+        :param season_id: Die Season, die beendet wird.
+        :param next_days: Länge der nächsten Season in Tagen, ``0`` für keine. Beim Fortsetzen
+            gilt der Wert, der beim Start des Wechsels gespeichert wurde.
+        :return: Die ID der neuen Season oder ``None``.
+        """
+        async with self.rollover_lock:
+            row = await self.db.fetchone("SELECT status, rollover_days FROM season WHERE guild_id = ? AND season_id = ?", (self.guild_id, season_id))
+            if row is None:
+                return None
+            status, days = row
+
+            if status in ("active", "paused"):
+                # Ab hier gibt keine Nachricht mehr XP, danach wird der Puffer geschrieben
+                if self.season.season_id == season_id:
+                    self.season.status = "archiving"
+                await self.xp_buffer.flush()
+                days = next_days or 0
+                now = datetime.datetime.now().isoformat()
+                await self.db.execute("""
+                    UPDATE season SET status = 'archiving', rollover_days = ?,
+                        end_date = CASE WHEN end_date IS NULL OR end_date > ? THEN ? ELSE end_date END
+                    WHERE season_id = ?
+                """, (days, now, now, season_id))
+                status = "archiving"
+            elif status not in ("archiving", "resetting"):
+                return None
+
+            if status == "archiving":
+                while await self.db.write(archive_chunk, self.guild_id, season_id, ROLLOVER_CHUNK) == ROLLOVER_CHUNK:
+                    pass
+                await self.db.execute("UPDATE season SET status = 'resetting' WHERE season_id = ?", (season_id,))
+
+            # Zurücksetzen ist idempotent und beginnt nach einer Unterbrechung einfach von vorn
+            after = 0
+            while after is not None:
+                after = await self.db.write(reset_chunk, self.guild_id, after, ROLLOVER_CHUNK)
+            new_season_id = await self.db.write(open_next_season, self.guild_id, season_id, days)
+
+            self.xp_buffer.reset()
+            self.ranking.load(await self.db.read(load_ranking, self.guild_id))
+            await self.season.load(self.db)
+            return new_season_id
+
+
+class GuildRegistry:
+    """
+    Ordnet jeder Gilde ihre Datenbank und ihren :class:`GuildState` zu.
+
+    Alle Gilden liegen in der gemeinsamen Datenbank, außer denen aus ``dedicated``:
+    diese bekommen eine eigene Datei (``<directory>/<guild_id>.db``) mit eigenem
+    Writer-Thread, damit eine sehr aktive Gilde die Schreibzugriffe der anderen nicht
+    ausbremst. Der Stand einer Gilde wird erst beim ersten Zugriff geladen.
+
+    Mit ``client`` (ein :class:`utils.storage_service.StorageClient`) gehen alle Schreibzugriffe
+    an den gemeinsamen Storage-Dienst der Shard-Prozesse; migriert hat der dann schon.
+    """
+
+    def __init__(self, path, dedicated=(), directory="database/guilds", readers=4, flush_size=500, client=None):
+        self.flush_size = flush_size
+        self.client = client
+        paths = database_paths(path, dedicated, directory)
+        if len(paths) > 1:
+            os.makedirs(directory, exist_ok=True)
+        self.shared = self._open(paths.pop(None), readers)
+        self._storages = {guild_id: self._open(guild_path, readers) for guild_id, guild_path in paths.items()}  # guild_id -> eigene Storage
+        self._states = {}
+        self._loading = {}  # guild_id -> laufender Ladevorgang
+
+    def _open(self, path, readers):
+        if self.client is not None:
+            return RemoteStorage(path, self.client, readers=readers)
+        db = Storage(path, readers=readers)
+        # Versionierte Migrationen: auf einer aktuellen Datenbank läuft keine DDL
+        applied = db.write_sync(migrate)
+        if applied:
+            print(f"Datenbank {path} migriert auf Version {applied[-1]}.")
+        warning = db.read_sync(unassigned_warning, path)
+        if warning:
+            print(warning)
+        return db
+
+    def set_observer(self, observer):
+        for db in self.storages():
+            db.observer = observer
+
+    def storage(self, guild_id):
+        return self._storages.get(guild_id, self.shared)
+
+    def storages(self):
+        return [self.shared, *self._storages.values()]
+
+    def states(self):
+        return list(self._states.values())
+
+    def loaded(self, guild_id):
+        """Gibt den Stand einer Gilde zurück, wenn er schon geladen ist, sonst ``None``."""
+        return self._states.get(guild_id)
+
+    async def get(self, guild_id):
+        state = self._states.get(guild_id)
+        if state is not None:
+            return state
+        # Gleichzeitige Anfragen für dieselbe Gilde warten auf denselben Ladevorgang
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.ensure_future(self._load(guild_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, guild_id):
+        try:
+            state = GuildState(guild_id, self.storage(guild_id), self.flush_size)
+            await state.load()
+            self._states[guild_id] = state
+            return state
+        finally:
+            self._loading.pop(guild_id, None)
+
+    def close(self):
+        for db in self.storages():
+            db.close()
@@ -0,0 +1,120 @@
+import asyncio
+import bisect
+import time
+from collections import OrderedDict
+
+
+class Ranking:
+    """
+    Sortierte Rangliste aller User im Speicher (Level absteigend, dann Prestige).
+
+    Wird beim Start einmal über den Index geladen und danach bei jeder Level- oder
+    Prestige-Änderung inkrementell angepasst. Die Position eines Users ist eine
+    Binärsuche, eine Seite des Leaderboards ein Slice.
+    """
+
+    def __init__(self):
+        self._keys = []  # sortiert: (-level, -prestige, user_id)
+        self._by_user = {}  # user_id -> Schlüssel
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._by_user
+
+    def load(self, rows):
+        """:param rows: Zeilen ``(user_id, level, prestige)``."""
+        self._by_user = {user_id: (-level, -prestige, user_id) for user_id, level, prestige in rows}
+        self._keys = sorted(self._by_user.values())
+
+    def update(self, user_id, level=None, prestige=None):
+        old = self._by_user.get(user_id)
+        if old is not None:
+            level = -old[0] if level is None else level
+            prestige = -old[1] if prestige is None else prestige
+        key = (-(level or 1), -(prestige or 0), user_id)
+        if key == old:
+            return
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, old)]
+        bisect.insort(self._keys, key)
+        self._by_user[user_id] = key
+
+    def position(self, user_id):
+        """Gibt die Position (ab 1) zurück oder ``None``, wenn der User nicht gelistet ist."""
+        key = self._by_user.get(user_id)
+        if key is None:
+            return None
+        return bisect.bisect_left(self._keys, key) + 1
+
+    def page(self, page, per_page=10):
+        """Gibt ``(position, user_id, level, prestige)`` für eine Seite (ab 1) zurück."""
+        start = (page - 1) * per_page
+        return [
+            (start + i + 1, user_id, -level, -prestige)
+            for i, (level, prestige, user_id) in enumerate(self._keys[start:start + per_page])
+        ]
+
+    def pages(self, per_page=10):
+        return max(1, -(-len(self._keys) // per_page))
+
+
+class NameCache:
+    """
+    Löst User-IDs in Anzeigenamen auf.
+
+    Zuerst wird der Member-Cache der Gilde bzw. der User-Cache des Bots gefragt. Nur was
+    dort fehlt, wird per REST nachgeladen, und zwar gleichzeitig statt nacheinander.
+    Nachgeladene Namen werden begrenzt und mit Ablaufzeit zwischengespeichert.
+    """
+
+    def __init__(self, bot, ttl=3600, max_size=5000):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache = OrderedDict()  # user_id -> (name, ablauf)
+
+    def _cached(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        name, expires = entry
+        if expires < time.monotonic():
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return name
+
+    def _store(self, user_id, name):
+        self._cache[user_id] = (name, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, user_id):
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except Exception:
+            return None
+        self._store(user_id, user.name)
+        return user.name
+
+    async def resolve(self, guild, user_ids):
+        """Gibt ``{user_id: name}`` für alle übergebenen IDs zurück."""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id) if guild else None
+            user = member or self.bot.get_user(user_id)
+            name = getattr(member, "display_name", None) or getattr(user, "name", None) or self._cached(user_id)
+            if name:
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            for user_id, name in zip(missing, fetched):
+                names[user_id] = name or f"Unbekannt ({user_id})"
+        return names
@@ -0,0 +1,176 @@
+import asyncio
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+
+
+# Obergrenzen der Buckets in Sekunden (wie bei Prometheus üblich)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Latenz-Histogramm mit festen Buckets. Ein Eintrag kostet eine Binärsuche und drei Additionen."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Schätzt ein Quantil anhand der Bucket-Grenzen (obere Grenze des Buckets)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Sammelt Latenzen und Zähler für den XPSystem-Cog.
+
+    Histogramme werden über einen Namen und ein Label-Tupel angesprochen, z. B.
+    ``metrics.observe("celestix_on_message_seconds", 0.001, phase="xp")``. Da SQL-Zeiten aus
+    den Worker-Threads der Storage kommen, ist das Eintragen durch ein Lock geschützt.
+
+    ``labels`` werden an jede Zeile der Prometheus-Datei gehängt, z. B. der Shard-Prozess.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = tuple(sorted((labels or {}).items()))
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> int
+        self._gauges = {}  # (name, labels) -> float
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def histograms(self, name):
+        """Gibt ``[(labels, Histogram)]`` für einen Namen zurück."""
+        with self._lock:
+            return [(dict(labels), histogram) for (key, labels), histogram in self._histograms.items() if key == name]
+
+    def sql_observer(self, label, seconds):
+        """Callback für :class:`utils.storage.Storage`, wird im Worker-Thread aufgerufen."""
+        self.observe("celestix_sql_seconds", seconds, statement=label)
+
+    def render(self):
+        """Gibt alle Werte im Prometheus-Textformat zurück."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        gauges = sorted(self._gauges.items())
+
+        lines = []
+        seen = set()
+        histograms = [((name, self.labels + labels), histogram) for (name, labels), histogram in histograms]
+        counters = [((name, self.labels + labels), value) for (name, labels), value in counters]
+        gauges = [((name, self.labels + labels), value) for (name, labels), value in gauges]
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Schreibt die Prometheus-Datei atomar, damit ein Scraper nie eine halbe Datei liest."""
+        text = self.render()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=512)
+def statement_label(sql, limit=80):
+    """Kürzt ein SQL-Statement auf eine einzeilige Bezeichnung für Metriken."""
+    return _WHITESPACE.sub(" ", sql).strip()[:limit]
+
+
+class LoopLagMonitor:
+    """Misst, wie viel später als geplant der Event-Loop einen kurzen Sleep wieder aufnimmt."""
+
+    def __init__(self, metrics, interval=0.5):
+        self.metrics = metrics
+        self.interval = interval
+        self._task = None
+
+    def start(self, loop):
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.metrics.observe("celestix_event_loop_lag_seconds", lag)
+            self.metrics.set("celestix_event_loop_lag_last_seconds", lag)
@@ -0,0 +1,377 @@
+import datetime
+
+
+def add_column(conn, table, column, definition):
+    """Fügt eine Spalte hinzu, falls sie noch nicht existiert (SQLite kennt kein ADD COLUMN IF NOT EXISTS)."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _initial_schema(conn):
+    # Entspricht dem bisherigen _initialize_db, daher überall IF NOT EXISTS:
+    # bestehende Datenbanken werden so ohne Änderung auf Version 1 gestempelt.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            coins INTEGER DEFAULT 0,
+            prestige INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rewards (
+            level INTEGER PRIMARY KEY,
+            reward_type TEXT,
+            reward_value TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shop (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_name TEXT,
+            item_price INTEGER,
+            item_role TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS season (
+            season_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_date TEXT,
+            end_date TEXT,
+            status TEXT DEFAULT 'inaktive'
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_name TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            reward TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS achievements (
+            achievement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,  -- Name des Achievements
+            description TEXT,  -- Beschreibung des Achievements
+            condition TEXT,  -- Bedingung (z. B. "prestige >= 1", "level >= 25")
+            reward TEXT  -- Belohnung (z. B. "500 Coins", "Exklusive Rolle")
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id INTEGER,
+            achievement_id INTEGER,
+            completed BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (user_id, achievement_id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weekly_challenges (
+            challenge_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            description TEXT,
+            condition TEXT,  -- Bedingung (z. B. "messages >= 100")
+            reward TEXT  -- Belohnung (z. B. "1000 Coins")
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_weekly_progress (
+            user_id INTEGER,
+            challenge_id INTEGER,
+            progress INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, challenge_id)
+        )
+    """)
+    # Deckt ORDER BY level DESC, prestige DESC komplett ab (user_id steckt als rowid im Index)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_ranking ON users (level DESC, prestige DESC)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+
+def _daily_and_lookup_indexes(conn):
+    # /daily liest und schreibt last_daily, die Spalte wurde aber nie angelegt
+    add_column(conn, "users", "last_daily", "TEXT")
+    # /buy und /remove_shop_item suchen nach Namen, Season-Befehle nach Status.
+    # user_weekly_progress und user_achievements brauchen keinen eigenen Index:
+    # ihr Primärschlüssel beginnt bereits mit user_id.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_shop_item_name ON shop (item_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_season_status ON season (status)")
+
+
+def _purchase_ledger(conn):
+    # Jeder Kauf wird protokolliert, in derselben Transaktion wie die Abbuchung
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS purchases (
+            purchase_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            item_id INTEGER,
+            item_name TEXT,
+            price INTEGER,
+            purchased_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_purchases_user ON purchases (user_id)")
+
+
+# Tabellen, deren Zeilen einer Gilde gehören (seit Version 4), mit ihrem neuen Schema
+GUILD_TABLES = {
+    "users": """
+        CREATE TABLE {name} (
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            coins INTEGER DEFAULT 0,
+            prestige INTEGER DEFAULT 0,
+            last_daily TEXT,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+    """,
+    "rewards": """
+        CREATE TABLE {name} (
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            level INTEGER NOT NULL,
+            reward_type TEXT,
+            reward_value TEXT,
+            PRIMARY KEY (guild_id, level)
+        ) WITHOUT ROWID
+    """,
+    "shop": """
+        CREATE TABLE {name} (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            item_name TEXT,
+            item_price INTEGER,
+            item_role TEXT
+        )
+    """,
+    "season": """
+        CREATE TABLE {name} (
+            season_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            start_date TEXT,
+            end_date TEXT,
+            status TEXT DEFAULT 'inaktive'
+        )
+    """,
+    "events": """
+        CREATE TABLE {name} (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            event_name TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            reward TEXT
+        )
+    """,
+    "achievements": """
+        CREATE TABLE {name} (
+            achievement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            name TEXT,
+            description TEXT,
+            condition TEXT,
+            reward TEXT
+        )
+    """,
+    "user_achievements": """
+        CREATE TABLE {name} (
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            achievement_id INTEGER NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (guild_id, user_id, achievement_id)
+        ) WITHOUT ROWID
+    """,
+    "weekly_challenges": """
+        CREATE TABLE {name} (
+            challenge_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            name TEXT,
+            description TEXT,
+            condition TEXT,
+            reward TEXT
+        )
+    """,
+    "user_weekly_progress": """
+        CREATE TABLE {name} (
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            challenge_id INTEGER NOT NULL,
+            progress INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, challenge_id)
+        ) WITHOUT ROWID
+    """,
+    "purchases": """
+        CREATE TABLE {name} (
+            purchase_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER,
+            item_id INTEGER,
+            item_name TEXT,
+            price INTEGER,
+            purchased_at TEXT
+        )
+    """,
+}
+
+
+def _guild_partitioning(conn):
+    # SQLite kann keinen Primärschlüssel ändern: jede Tabelle wird neu angelegt und umkopiert.
+    # Bestehende Zeilen landen in Gilde 0, tools/migrate_guilds.py ordnet sie danach einer Gilde zu.
+    for table, schema in GUILD_TABLES.items():
+        columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+        conn.execute(schema.format(name=f"{table}_new"))
+        conn.execute(f"INSERT INTO {table}_new (guild_id, {columns}) SELECT 0, {columns} FROM {table}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    # Die Primärschlüssel beginnen mit guild_id und decken damit alle Abfragen pro User ab.
+    # In WITHOUT-ROWID-Tabellen enthält jeder Index den Primärschlüssel, der Ranglisten-Index
+    # liefert (guild_id, user_id, level, prestige) also ohne Zugriff auf die Tabelle.
+    conn.execute("CREATE INDEX idx_users_guild_ranking ON users (guild_id, level DESC, prestige DESC)")
+    conn.execute("CREATE INDEX idx_shop_guild_item_name ON shop (guild_id, item_name)")
+    conn.execute("CREATE INDEX idx_season_guild_status ON season (guild_id, status)")
+    conn.execute("CREATE INDEX idx_events_guild ON events (guild_id, event_id)")
+    conn.execute("CREATE INDEX idx_achievements_guild ON achievements (guild_id)")
+    conn.execute("CREATE INDEX idx_weekly_challenges_guild ON weekly_challenges (guild_id)")
+    conn.execute("CREATE INDEX idx_purchases_guild_user ON purchases (guild_id, user_id)")
+
+
+def _season_results(conn):
+    # Endstände jeder Season; der Primärschlüssel liefert /season_history seitenweise nach Platz
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS season_results (
+            guild_id INTEGER NOT NULL,
+            season_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            xp INTEGER,
+            level INTEGER,
+            prestige INTEGER,
+            PRIMARY KEY (guild_id, season_id, rank)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_season_results_user ON season_results (guild_id, user_id, season_id)")
+    # Länge der nächsten Season, damit ein unterbrochener Saisonwechsel korrekt fortgesetzt wird
+    add_column(conn, "season", "rollover_days", "INTEGER")
+
+
+def _activity_rollups(conn):
+    # Aktivität in Stunden- und Tages-Buckets (Unix-Zeit // 3600 bzw. // 86400, also UTC).
+    # Neue Einträge landen nur stündlich, utils/activity.py fasst abgeschlossene Tage zusammen
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            guild_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            xp INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, user_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            guild_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            xp INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, user_id)
+        ) WITHOUT ROWID
+    """)
+    # Verlauf eines Users für /rank komplett aus dem Index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_daily_user ON activity_daily (guild_id, user_id, day, xp, messages)")
+
+
+def _weekly_progress_week(conn):
+    # Woche des Fortschritts, damit der Wochenwechsel nur Zeilen älterer Wochen löscht.
+    # Bisheriger Fortschritt gehört zur zuletzt zurückgesetzten Woche
+    add_column(conn, "user_weekly_progress", "week", "TEXT")
+    conn.execute("UPDATE user_weekly_progress SET week = (SELECT value FROM bot_state WHERE key = 'weekly_reset')")
+
+
+# Reihenfolge ist verbindlich: neue Schritte immer nur hinten anhängen
+MIGRATIONS = [
+    (1, "Grundschema", _initial_schema),
+    (2, "last_daily und Indizes für Shop und Season", _daily_and_lookup_indexes),
+    (3, "Kaufprotokoll", _purchase_ledger),
+    (4, "Daten pro Gilde", _guild_partitioning),
+    (5, "Archiv der Season-Ergebnisse", _season_results),
+    (6, "Aktivität pro Stunde und Tag", _activity_rollups),
+    (7, "Woche im Fortschritt der Herausforderungen", _weekly_progress_week),
+]
+
+# Alle Tabellen mit guild_id, z. B. für tools/migrate_guilds.py
+PARTITIONED_TABLES = [*GUILD_TABLES, "season_results", "activity_hourly", "activity_daily"]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def unassigned_warning(conn, path):
+    """
+    Warnung für Zeilen aus der Zeit vor den Gilden-Daten (``guild_id = 0``), sonst ``None``.
+
+    Migration 4 legt alle alten Daten in Gilde 0 ab. Der Bot zeigt sie keiner echten Gilde,
+    bis sie mit ``tools/migrate_guilds.py`` zugeordnet wurden.
+    """
+    tables = [
+        table for table in PARTITIONED_TABLES
+        if conn.execute(f"SELECT 1 FROM {table} WHERE guild_id = 0 LIMIT 1").fetchone()
+    ]
+    if not tables:
+        return None
+    return (
+        f"ACHTUNG: {path} enthält noch Daten ohne Gilde ({', '.join(tables)}). "
+        f"Der Bot zeigt sie keinem Server an, bis sie zugeordnet sind: "
+        f"Bot stoppen und python tools/migrate_guilds.py --database {path} --guild-id <ID des Servers> ausführen."
+    )
+
+
+def current_version(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+    if not exists:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Bringt die Datenbank auf den neuesten Stand.
+
+    Ist die Datenbank bereits aktuell, wird keinerlei DDL ausgeführt. Sonst laufen alle
+    ausstehenden Schritte in einer einzigen Transaktion, sodass ein Fehler die Datenbank
+    im alten Zustand zurücklässt.
+
+    :return: Die Liste der angewendeten Versionen.
+    """
+    version = current_version(conn)
+    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+    if not pending:
+        return []
+
+    # DDL startet in sqlite3 keine implizite Transaktion, daher explizit
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    """)
+    applied_at = datetime.datetime.now().isoformat()
+    for number, description, step in pending:
+        step(conn)
+        conn.execute(
+            "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+            (number, description, applied_at)
+        )
+    return [number for number, _, _ in pending]
@@ -0,0 +1,137 @@
+import math
+
+import discord
+
+
+# Einträge pro Seite, passt auch mit langen Beschreibungen unter das Nachrichtenlimit
+PER_PAGE = 10
+
+# Maximale Länge einer Discord-Nachricht
+MESSAGE_LIMIT = 2000
+
+
+def page_count(total, per_page=PER_PAGE):
+    return max(1, math.ceil(total / per_page))
+
+
+def render_page(title, lines, page, pages=None, footer=None):
+    """
+    Baut den Text einer Seite.
+
+    :param page: Die Seite, ab 0 gezählt.
+    :param pages: Die Anzahl der Seiten, falls bekannt.
+    """
+    position = f"{page + 1}/{pages}" if pages else f"{page + 1}"
+    parts = [f"**{title} (Seite {position}):**", *lines]
+    if footer:
+        parts += ["", footer]
+    return "\n".join(parts)[:MESSAGE_LIMIT]
+
+
+class PageCache:
+    """
+    Zwischenspeicher für Seiten, die für alle User gleich sind (z. B. der Shop einer Gilde).
+
+    Die Admin-Befehle, die die zugrunde liegenden Daten ändern, leeren den Cache mit
+    :meth:`clear`. Ein Ergebnis, das während eines ``clear`` berechnet wurde, wird
+    verworfen statt gespeichert, damit keine veraltete Seite hängen bleibt.
+    """
+
+    def __init__(self, max_size=100):
+        self.max_size = max_size
+        self._pages = {}
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    async def get(self, key, build):
+        """Gibt die Seite ``key`` zurück und baut sie bei Bedarf mit ``await build()``."""
+        if key in self._pages:
+            return self._pages[key]
+        generation = self._generation
+        value = await build()
+        if generation == self._generation:
+            if len(self._pages) >= self.max_size:
+                # Älteste Seite zuerst verwerfen (Dictionaries behalten die Einfügereihenfolge)
+                self._pages.pop(next(iter(self._pages)))
+            self._pages[key] = value
+        return value
+
+    def clear(self):
+        self._generation += 1
+        self._pages.clear()
+
+
+class KeysetPages:
+    """
+    Blättert per Keyset statt OFFSET: jede Seite beginnt nach dem letzten Schlüssel der
+    vorherigen (``WHERE key > ? ORDER BY key LIMIT ?``), die Kosten hängen also nicht
+    davon ab, wie weit hinten die Seite liegt.
+
+    ``fetch(after, limit)`` gibt Zeilen zurück, deren erste Spalte der Schlüssel ist.
+    """
+
+    def __init__(self, fetch, per_page=PER_PAGE):
+        self.fetch = fetch
+        self.per_page = per_page
+        self._starts = [0]  # Schlüssel, nach dem die jeweilige Seite beginnt
+
+    async def get(self, page):
+        """Gibt ``(zeilen, has_next)`` zurück. Es kann nur bis eine Seite hinter die bekannten geblättert werden."""
+        rows = await self.fetch(self._starts[page], self.per_page + 1)
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if has_next and len(self._starts) == page + 1:
+            self._starts.append(rows[-1][0])
+        return rows, has_next
+
+
+class PageView(discord.ui.View):
+    """
+    Buttons zum Blättern.
+
+    ``render(page)`` gibt ``(text, has_next)`` zurück und wird erst beim Klick aufgerufen,
+    geladen wird also immer nur die Seite, die gerade angezeigt wird.
+    """
+
+    def __init__(self, render, author_id, timeout=180):
+        super().__init__(timeout=timeout, disable_on_timeout=True)
+        self.render = render
+        self.author_id = author_id
+        self.page = 0
+
+    def update_buttons(self, has_next):
+        self.previous.disabled = self.page == 0
+        self.next.disabled = not has_next
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id == self.author_id:
+            return True
+        await interaction.response.send_message("Nur wer den Befehl ausgeführt hat, kann blättern.", ephemeral=True)
+        return False
+
+    async def show(self, interaction, page):
+        text, has_next = await self.render(page)
+        self.page = page
+        self.update_buttons(has_next)
+        await interaction.response.edit_message(content=text, view=self)
+
+    @discord.ui.button(label="Zurück", style=discord.ButtonStyle.secondary)
+    async def previous(self, button, interaction):
+        await self.show(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label="Weiter", style=discord.ButtonStyle.secondary)
+    async def next(self, button, interaction):
+        await self.show(interaction, self.page + 1)
+
+
+async def send_paginated(ctx, render, **kwargs):
+    """Schickt die erste Seite. Buttons gibt es nur, wenn es mehr als eine Seite gibt."""
+    text, has_next = await render(0)
+    if not has_next:
+        await ctx.respond(text, **kwargs)
+        return
+    view = PageView(render, ctx.author.id)
+    view.update_buttons(has_next)
+    await ctx.respond(text, view=view, **kwargs)
@@ -0,0 +1,90 @@
+import time
+
+
+class TokenBucket:
+    """
+    Token-Bucket pro Schlüssel, gespeichert als eine einzige Zahl pro Eintrag.
+
+    Statt ``(tokens, zeitpunkt)`` wird nur der Zeitpunkt gespeichert, an dem der Bucket
+    wieder voll wäre (GCRA). Ein Eintrag, dessen Zeitpunkt in der Vergangenheit liegt,
+    verhält sich genau wie ein fehlender Eintrag und kann jederzeit verworfen werden.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        :param rate: Erlaubte Ereignisse pro Sekunde im Dauerbetrieb.
+        :param burst: Wie viele Ereignisse auf einmal erlaubt sind.
+        """
+        self.interval = 1.0 / rate
+        self.window = self.interval * burst
+        self._full_at = {}
+
+    def __len__(self):
+        return len(self._full_at)
+
+    def allow(self, key, now):
+        full_at = self._full_at.get(key, now)
+        if full_at < now:
+            full_at = now
+        if full_at + self.interval - now > self.window:
+            return False
+        self._full_at[key] = full_at + self.interval
+        return True
+
+    def evict(self, now):
+        """Entfernt alle Einträge, deren Bucket wieder voll ist. Gibt die Anzahl zurück."""
+        idle = [key for key, full_at in self._full_at.items() if full_at <= now]
+        for key in idle:
+            del self._full_at[key]
+        return len(idle)
+
+
+class XPRateLimiter:
+    """
+    Entscheidet vor jeder SQL-Arbeit, ob eine Nachricht XP gibt.
+
+    Es gibt je einen Bucket pro User und pro Gilde, dazu eine Mindestlänge für Nachrichten.
+    Gedrosselte Nachrichten kosten nur ein paar Dictionary-Zugriffe.
+    """
+
+    def __init__(self, user_rate=1 / 20, user_burst=3, guild_rate=50, guild_burst=200, min_length=3, sweep_interval=300):
+        self.users = TokenBucket(user_rate, user_burst)
+        self.guilds = TokenBucket(guild_rate, guild_burst)
+        self.min_length = min_length
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls(
+            user_rate=settings.get("user_per_minute", 3) / 60,
+            user_burst=settings.get("user_burst", 3),
+            guild_rate=settings.get("guild_per_second", 50),
+            guild_burst=settings.get("guild_burst", 200),
+            min_length=settings.get("min_length", 3),
+        )
+
+    def check(self, message):
+        """
+        Gibt ``None`` zurück, wenn die Nachricht XP geben darf, sonst den Grund der Drosselung.
+        """
+        content = message.content or ""
+        if len(content) < self.min_length or len(content.strip()) < self.min_length:
+            return "length"
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        # Erst den User prüfen, damit ein einzelner Spammer nicht das Gilden-Budget verbraucht
+        if not self.users.allow(message.author.id, now):
+            return "user"
+        guild = message.guild
+        if guild is not None and not self.guilds.allow(guild.id, now):
+            return "guild"
+        return None
+
+    def sweep(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._next_sweep = now + self.sweep_interval
+        return self.users.evict(now) + self.guilds.evict(now)
@@ -0,0 +1,113 @@
+import asyncio
+import contextlib
+
+import aiohttp
+import discord
+
+
+class RewardDispatcher:
+    """
+    Stellt Level-Belohnungen im Hintergrund zu.
+
+    ``on_message`` legt nur Aufträge in die Warteschlange und kehrt sofort zurück.
+    Worker-Tasks arbeiten die Aufträge ab, wobei Aufrufe derselben Route (z. B. alle
+    Member-Edits einer Gilde) nacheinander laufen, damit keine Rate-Limits ausgelöst
+    werden. Mehrere Rollen für denselben Member werden zu einem einzigen Edit
+    zusammengefasst, vorübergehende Fehler werden mit Backoff wiederholt.
+    """
+
+    def __init__(self, workers=2, retries=3):
+        self.workers = workers
+        self.retries = retries
+        self._queue = asyncio.Queue()
+        self._roles = {}  # (guild_id, member_id) -> [member, {role_id: role}, [nachrichten]]
+        self._routes = {}  # route -> [asyncio.Lock, Anzahl Aufträge, die ihn halten oder darauf warten]
+        self._tasks = []
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def start(self, loop):
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def grant_role(self, member, role, message=None):
+        key = (member.guild.id, member.id)
+        entry = self._roles.get(key)
+        if entry is None:
+            entry = self._roles[key] = [member, {}, []]
+            self._queue.put_nowait(("role", key))
+        entry[1][role.id] = role
+        if message:
+            entry[2].append(message)
+
+    def send(self, user, message):
+        self.submit(("dm", user.id), lambda: user.send(message))
+
+    def allow_channel(self, member, channel, message=None):
+        self.submit(("channel", channel.id), lambda: channel.set_permissions(member, read_messages=True))
+        if message:
+            self.send(member, message)
+
+    def submit(self, route, job):
+        """Legt einen beliebigen Auftrag ab. ``job`` ist eine Funktion, die eine Coroutine liefert."""
+        self._queue.put_nowait((route, job))
+
+    async def join(self):
+        await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            route, job = await self._queue.get()
+            try:
+                if route == "role":
+                    await self._grant_roles(job)
+                else:
+                    await self._run(route, job)
+            except Exception as e:
+                print(f"Belohnung konnte nicht zugestellt werden: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    async def _grant_roles(self, key):
+        member, roles, messages = self._roles.pop(key)
+        ok = await self._run(("member", key[0]), lambda: member.add_roles(*roles.values()))
+        if ok:
+            for message in messages:
+                self.send(member, message)
+
+    @contextlib.asynccontextmanager
+    async def _route(self, route):
+        # Jeder DM-Empfänger und Channel ist eine eigene Route; ungenutzte Locks werden wieder entfernt
+        entry = self._routes.get(route)
+        if entry is None:
+            entry = self._routes[route] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._routes[route]
+
+    async def _run(self, route, job):
+        for attempt in range(self.retries):
+            try:
+                async with self._route(route):
+                    await job()
+                return True
+            except (discord.Forbidden, discord.NotFound):
+                return False
+            except discord.HTTPException as e:
+                # 4xx außer 429 sind endgültig, alles andere ist einen neuen Versuch wert
+                if e.status < 500 and e.status != 429:
+                    return False
+            except (asyncio.TimeoutError, aiohttp.ClientError, OSError):
+                pass
+            await asyncio.sleep(2 ** attempt)
+        return False
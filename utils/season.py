@@ -0,0 +1,148 @@
+import datetime
+import time
+
+
+class SeasonState:
+    """
+    Zwischengespeicherter Stand der aktuellen Season.
+
+    Wird pro Gilde einmal geladen und danach nur von den Season-Befehlen und
+    ``check_season`` aktualisiert. ``end_date`` liegt bereits als Timestamp vor,
+    damit ``on_message`` ohne SQL und ohne ``fromisoformat`` prüfen kann, ob XP zählen.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.season_id = None
+        self.start_date = None
+        self.end_date = None
+        self.status = None
+        self.end_ts = None
+
+    def set(self, row):
+        if row is None:
+            self.season_id = self.start_date = self.end_date = self.status = self.end_ts = None
+            return
+        self.season_id, self.start_date, self.end_date, self.status = row
+        self.end_ts = None
+        if self.end_date:
+            # Seasons werden auch von Hand angelegt; ein falsches Datum darf die Gilde nicht lahmlegen
+            try:
+                self.end_ts = datetime.datetime.fromisoformat(self.end_date).timestamp()
+            except (TypeError, ValueError):
+                print(f"Season {self.season_id} der Gilde {self.guild_id} hat kein gültiges Enddatum ({self.end_date!r}), sie läuft ohne Ende.")
+
+    @staticmethod
+    def fetch(conn, guild_id):
+        # Eine aktive Season hat Vorrang, sonst die zuletzt angelegte
+        return conn.execute("""
+            SELECT season_id, start_date, end_date, status FROM season WHERE guild_id = ?
+            ORDER BY status = 'active' DESC, season_id DESC LIMIT 1
+        """, (guild_id,)).fetchone()
+
+    async def load(self, db):
+        self.set(await db.read(self.fetch, self.guild_id))
+
+    @property
+    def exists(self):
+        return self.season_id is not None
+
+    @property
+    def expired(self):
+        return self.end_ts is not None and time.time() >= self.end_ts
+
+    @property
+    def active(self):
+        return self.status == "active" and not self.expired
+
+    @property
+    def length_days(self):
+        """Geplante Länge der Season in ganzen Tagen, mindestens 1."""
+        if not self.start_date or self.end_ts is None:
+            return None
+        try:
+            start = datetime.datetime.fromisoformat(self.start_date)
+        except (TypeError, ValueError):
+            return None
+        return max(1, (datetime.datetime.fromisoformat(self.end_date) - start).days)
+
+    def time_left(self):
+        if self.end_ts is None:
+            return None
+        return datetime.timedelta(seconds=self.end_ts - time.time())
+
+    def pause(self):
+        if self.status == "active":
+            self.status = "paused"
+
+
+# Zeilen pro Transaktion beim Saisonwechsel; zwischen den Blöcken kommen andere Schreibzugriffe dran
+ROLLOVER_CHUNK = 5000
+
+_ARCHIVE = """
+    INSERT INTO season_results (guild_id, season_id, rank, user_id, xp, level, prestige)
+    SELECT guild_id, ?, ? + ROW_NUMBER() OVER (ORDER BY level DESC, prestige DESC, user_id), user_id, xp, level, prestige
+    FROM (
+        SELECT guild_id, user_id, xp, level, prestige FROM users
+        WHERE guild_id = ? AND {where}
+        ORDER BY level DESC, prestige DESC, user_id LIMIT ?
+    )
+"""
+
+
+def archive_chunk(conn, guild_id, season_id, size=ROLLOVER_CHUNK):
+    """
+    Übernimmt die nächsten ``size`` Plätze der Rangliste nach ``season_results``.
+
+    Setzt hinter dem zuletzt archivierten Platz fort, ein unterbrochener Wechsel kann also
+    einfach erneut gestartet werden. Die Reihenfolge entspricht der von :class:`utils.leaderboard.Ranking`.
+
+    :return: Die Anzahl der übernommenen Zeilen.
+    """
+    last = conn.execute(
+        "SELECT rank, level, prestige, user_id FROM season_results WHERE guild_id = ? AND season_id = ? ORDER BY rank DESC LIMIT 1",
+        (guild_id, season_id)
+    ).fetchone()
+    if last is None:
+        return conn.execute(_ARCHIVE.format(where="1"), (season_id, 0, guild_id, size)).rowcount
+
+    rank, level, prestige, user_id = last
+    # Zwei Bereichsabfragen auf dem Ranglisten-Index statt eines OR, das den Index nicht nutzen kann:
+    # zuerst der Rest der aktuellen (level, prestige)-Gruppe, danach alle folgenden Gruppen
+    count = conn.execute(
+        _ARCHIVE.format(where="level = ? AND prestige = ? AND user_id > ?"),
+        (season_id, rank, guild_id, level, prestige, user_id, size)
+    ).rowcount
+    if count < size:
+        count += conn.execute(
+            _ARCHIVE.format(where="(level, prestige) < (?, ?)"),
+            (season_id, rank + count, guild_id, level, prestige, size - count)
+        ).rowcount
+    return count
+
+
+def reset_chunk(conn, guild_id, after, size=ROLLOVER_CHUNK):
+    """
+    Setzt XP und Level der nächsten ``size`` User (nach ``user_id``) zurück.
+
+    :return: Die letzte bearbeitete ``user_id`` oder ``None``, wenn nichts mehr übrig ist.
+    """
+    last = conn.execute(
+        "SELECT MAX(user_id) FROM (SELECT user_id FROM users WHERE guild_id = ? AND user_id > ? ORDER BY user_id LIMIT ?)",
+        (guild_id, after, size)
+    ).fetchone()[0]
+    if last is not None:
+        conn.execute("UPDATE users SET xp = 0, level = 1 WHERE guild_id = ? AND user_id > ? AND user_id <= ?", (guild_id, after, last))
+    return last
+
+
+def open_next_season(conn, guild_id, season_id, days):
+    """Schließt den Wechsel ab und legt bei ``days > 0`` die nächste Season an. Gibt deren ID zurück."""
+    conn.execute("UPDATE season SET status = 'ended' WHERE season_id = ?", (season_id,))
+    if not days:
+        return None
+    now = datetime.datetime.now()
+    return conn.execute(
+        "INSERT INTO season (guild_id, start_date, end_date, status) VALUES (?, ?, ?, 'active')",
+        (guild_id, now.isoformat(), (now + datetime.timedelta(days=days)).isoformat())
+    ).lastrowid
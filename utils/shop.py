@@ -0,0 +1,63 @@
+class ShopCatalog:
+    """
+    Der Shop im Speicher, nach Name.
+
+    Wird mit der Gilde geladen und von ``add_shop_item`` bzw. ``remove_shop_item`` neu
+    geladen; ``/shop`` und ``/buy`` lesen nur noch hieraus.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self._items = []  # (item_id, item_name, item_price, item_role), nach ID sortiert
+        self._by_name = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def fetch(conn, guild_id):
+        return conn.execute(
+            "SELECT item_id, item_name, item_price, item_role FROM shop WHERE guild_id = ? ORDER BY item_id",
+            (guild_id,)
+        ).fetchall()
+
+    def set(self, rows):
+        self._items = list(rows)
+        self._by_name = {}
+        for item in self._items:
+            # Bei doppelten Namen gilt wie bisher der erste Eintrag
+            self._by_name.setdefault(item[1], item)
+
+    async def load(self, db):
+        self.set(await db.read(self.fetch, self.guild_id))
+
+    def get(self, item_name):
+        return self._by_name.get(item_name)
+
+    def page(self, page, per_page=10):
+        """Gibt die Gegenstände einer Seite zurück, ``page`` ab 0 gezählt."""
+        return self._items[page * per_page:(page + 1) * per_page]
+
+
+def purchase(conn, guild_id, user_id, item, purchased_at):
+    """
+    Kauft einen Gegenstand in einer Transaktion.
+
+    Die Coins werden nur abgebucht, wenn genug vorhanden sind. Damit können parallele
+    Käufe den Kontostand nie ins Minus treiben, und ein fehlender User-Eintrag zählt
+    einfach als zu wenig Coins.
+
+    :return: ``True``, wenn der Kauf durchgeführt wurde.
+    """
+    item_id, item_name, price, _ = item
+    updated = conn.execute(
+        "UPDATE users SET coins = coins - ? WHERE guild_id = ? AND user_id = ? AND coins >= ?",
+        (price, guild_id, user_id, price)
+    ).rowcount
+    if not updated:
+        return False
+    conn.execute(
+        "INSERT INTO purchases (guild_id, user_id, item_id, item_name, price, purchased_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (guild_id, user_id, item_id, item_name, price, purchased_at)
+    )
+    return True
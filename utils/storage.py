@@ -0,0 +1,124 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import statement_label
+
+
+# Auf Modulebene statt als Lambda, damit sie sich auch an den StorageService schicken lassen
+def execute(conn, sql, params=()):
+    return conn.execute(sql, params).rowcount
+
+
+def executemany(conn, sql, rows):
+    return conn.executemany(sql, rows).rowcount
+
+
+def fetchone(conn, sql, params=()):
+    return conn.execute(sql, params).fetchone()
+
+
+def fetchall(conn, sql, params=()):
+    return conn.execute(sql, params).fetchall()
+
+
+class Storage:
+    """
+    Asynchroner Zugriff auf die SQLite-Datenbank.
+
+    Alle Abfragen laufen auf Worker-Threads, damit der Event-Loop (und damit der
+    Gateway-Heartbeat) nie auf die Festplatte wartet. Schreibzugriffe laufen
+    serialisiert über einen einzigen Writer-Thread, Lesezugriffe über einen kleinen
+    Pool mit eigenen Verbindungen. Dank WAL-Modus blockieren Leser die Schreiber nicht
+    und umgekehrt.
+    """
+
+    def __init__(self, path, readers=4):
+        self.path = path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="celestix-db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="celestix-db-reader")
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._trace = None
+        self.observer = None  # observer(label, sekunden), z. B. Metrics.sql_observer
+
+    def _connect(self, readonly):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            if readonly:
+                conn.execute("PRAGMA query_only=1")
+            conn.set_trace_callback(self._trace)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def set_trace(self, callback):
+        """Setzt einen Trace-Callback (``callback(sql)``) für alle bestehenden und künftigen Verbindungen."""
+        with self._lock:
+            self._trace = callback
+            for conn in self._connections:
+                conn.set_trace_callback(callback)
+
+    def _timed(self, label, fn, conn, args):
+        observer = self.observer
+        if observer is None:
+            return fn(conn, *args)
+        started = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            observer(label or fn.__qualname__, time.perf_counter() - started)
+
+    def _run_write(self, fn, args, label=None):
+        conn = self._connect(readonly=False)
+        with conn:
+            return self._timed(label, fn, conn, args)
+
+    def _run_read(self, fn, args, label=None):
+        return self._timed(label, fn, self._connect(readonly=True), args)
+
+    async def write(self, fn, *args, label=None):
+        """Führt ``fn(conn, *args)`` im Writer-Thread innerhalb einer Transaktion aus."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run_write, fn, args, label)
+
+    async def read(self, fn, *args, label=None):
+        """Führt ``fn(conn, *args)`` auf einer Leser-Verbindung aus."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args, label)
+
+    def write_sync(self, fn, *args):
+        """Blockierende Variante von :meth:`write` für Start und Herunterfahren."""
+        return self._writer.submit(self._run_write, fn, args).result()
+
+    def read_sync(self, fn, *args):
+        """Blockierende Variante von :meth:`read`, z. B. zum Vorladen von Caches beim Start."""
+        return self._readers.submit(self._run_read, fn, args).result()
+
+    async def execute(self, sql, params=()):
+        return await self.write(execute, sql, params, label=statement_label(sql))
+
+    async def executemany(self, sql, rows):
+        return await self.write(executemany, sql, rows, label=statement_label(sql))
+
+    async def fetchone(self, sql, params=()):
+        return await self.read(fetchone, sql, params, label=statement_label(sql))
+
+    async def fetchall(self, sql, params=()):
+        return await self.read(fetchall, sql, params, label=statement_label(sql))
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
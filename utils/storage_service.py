@@ -0,0 +1,276 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from multiprocessing.connection import Client, Listener
+
+from utils.migrations import migrate, unassigned_warning
+from utils.storage import Storage
+
+
+# Höchstens so viele Schreibaufträge landen in einer Transaktion
+WRITE_BATCH = 256
+
+
+def _run_batch(conn, batch):
+    # Ohne explizites BEGIN würde das RELEASE des ersten Savepoints die Transaktion schon committen
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    results = []
+    for _, _, fn, args in batch:
+        conn.execute("SAVEPOINT request")
+        try:
+            result = fn(conn, *args)
+        except Exception as e:
+            conn.execute("ROLLBACK TO request")
+            conn.execute("RELEASE request")
+            results.append((e, None))
+        else:
+            conn.execute("RELEASE request")
+            results.append((None, result))
+    return results
+
+
+class StorageService:
+    """
+    Einziger Schreiber für alle Datenbanken, wenn der Bot auf mehrere Prozesse verteilt läuft.
+
+    Die Shard-Prozesse lesen selbst (im WAL-Modus dürfen beliebig viele Prozesse lesen),
+    schicken aber jeden Schreibzugriff hierher. Pro Datenbank sammelt ein Thread die Aufträge
+    aller Prozesse und führt alles, was seit dem letzten Commit angekommen ist, in einer
+    gemeinsamen Transaktion aus. Jeder Auftrag läuft in einem eigenen Savepoint, ein Fehler
+    trifft also nur ihn. Unter Last werden die Transaktionen größer statt zahlreicher, und
+    um die Schreibsperre konkurriert nie mehr als eine Verbindung.
+
+    Aufträge sind ``fn(conn, *args)`` wie bei :meth:`utils.storage.Storage.write`. ``fn`` wird
+    per Pickle übertragen, muss also eine Funktion auf Modulebene oder eine ``staticmethod`` sein.
+    """
+
+    def __init__(self, paths, batch_size=WRITE_BATCH, authkey=None):
+        self.batch_size = batch_size
+        self._storages = {}
+        self._queues = {}
+        for path in paths:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = Storage(path, readers=1)
+            applied = db.write_sync(migrate)
+            if applied:
+                print(f"Datenbank {path} migriert auf Version {applied[-1]}.")
+            warning = db.write_sync(unassigned_warning, path)
+            if warning:
+                print(warning)
+            self._storages[path] = db
+            self._queues[path] = queue.Queue()
+        self._listener = Listener(authkey=authkey)
+        self.address = self._listener.address
+        self._threads = []
+
+    def start(self):
+        for path in self._storages:
+            self._spawn(self._write_loop, path, name=f"celestix-storage-{os.path.basename(path)}")
+        self._spawn(self._accept_loop, name="celestix-storage-accept", daemon=True)
+
+    def _spawn(self, target, *args, name, daemon=False):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=daemon)
+        thread.start()
+        if not daemon:
+            self._threads.append(thread)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # Listener wurde geschlossen
+            except Exception as e:
+                # Z. B. ein Prozess mit falschem Schlüssel
+                print(f"Verbindung zum Storage-Dienst abgelehnt: {e}")
+                continue
+            self._spawn(self._client_loop, conn, name="celestix-storage-client", daemon=True)
+
+    def _client_loop(self, conn):
+        lock = threading.Lock()
+
+        def reply(request_id, error, result):
+            with lock:
+                try:
+                    conn.send((request_id, error, result))
+                except (OSError, EOFError):
+                    pass  # Der Prozess ist schon weg
+                except Exception as e:
+                    # Ergebnis oder Fehler ließ sich nicht pickeln; gesendet wurde dann noch nichts
+                    conn.send((request_id, RuntimeError(repr(error or e)), None))
+
+        while True:
+            try:
+                request_id, path, payload = conn.recv()
+            except (OSError, EOFError):
+                break
+            if request_id is None:
+                break  # Der Prozess meldet sich ab
+            try:
+                fn, args = pickle.loads(payload)
+                requests = self._queues[path]
+            except KeyError:
+                reply(request_id, KeyError(f"Unbekannte Datenbank: {path}"), None)
+                continue
+            except Exception as e:
+                reply(request_id, e, None)
+                continue
+            requests.put((reply, request_id, fn, args))
+        conn.close()
+
+    def _write_loop(self, path):
+        db = self._storages[path]
+        requests = self._queues[path]
+        stopping = False
+        while not stopping:
+            item = requests.get()
+            if item is None:
+                break
+            batch = [item]
+            # Alles mitnehmen, was während des letzten Commits angekommen ist
+            while len(batch) < self.batch_size:
+                try:
+                    item = requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                results = db.write_sync(_run_batch, batch)
+            except Exception as e:
+                # Der Commit selbst ist fehlgeschlagen, damit auch jeder einzelne Auftrag
+                results = [(e, None)] * len(batch)
+            for (reply, request_id, _, _), (error, result) in zip(batch, results):
+                reply(request_id, error, result)
+
+    def close(self):
+        self._listener.close()
+        for requests in self._queues.values():
+            requests.put(None)
+        for thread in self._threads:
+            thread.join()
+        for db in self._storages.values():
+            db.close()
+
+
+def run_service(paths, batch_size, authkey, ready, stop):
+    """
+    Einstiegspunkt für den Prozess des :class:`StorageService`.
+
+    Die Adresse wird über ``ready`` zurückgemeldet, sobald alle Migrationen gelaufen sind.
+    Beendet wird der Dienst nur über ``stop`` (oder wenn der Elternprozess verschwindet),
+    damit die Shard-Prozesse beim Herunterfahren ihre Puffer noch schreiben können.
+    """
+    # Strg+C und SIGTERM treffen oft die ganze Prozessgruppe, der Dienst soll aber als Letzter gehen
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    service = StorageService(paths, batch_size, authkey)
+    service.start()
+    ready.send(service.address)
+    ready.close()
+    parent = multiprocessing.parent_process()
+    try:
+        while not stop.wait(1):
+            if parent is not None and not parent.is_alive():
+                break
+    finally:
+        service.close()
+
+
+def _resolve(future, error, result):
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass  # Der wartende Task wurde abgebrochen; der Auftrag selbst ist trotzdem gelaufen
+
+
+class StorageClient:
+    """Verbindung eines Shard-Prozesses zum :class:`StorageService`, von allen Datenbanken geteilt."""
+
+    def __init__(self, address, authkey):
+        self._conn = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+        self._pending = {}  # request_id -> Future
+        self._ids = itertools.count()
+        self._closed = False
+        self._receiver = threading.Thread(target=self._receive, name="celestix-storage-receiver", daemon=True)
+        self._receiver.start()
+
+    def submit(self, path, fn, args):
+        """Schickt ``fn(conn, *args)`` an den Dienst. Gibt ein :class:`concurrent.futures.Future` zurück."""
+        payload = pickle.dumps((fn, args))
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("Der Storage-Dienst ist nicht erreichbar.")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self._conn.send((request_id, path, payload))
+        return future
+
+    def _receive(self):
+        try:
+            while True:
+                request_id, error, result = self._conn.recv()
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is not None:
+                    _resolve(future, error, result)
+        except (OSError, EOFError):
+            pass
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            _resolve(future, ConnectionError("Die Verbindung zum Storage-Dienst wurde getrennt."), None)
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                try:
+                    self._conn.send((None, None, None))
+                except OSError:
+                    pass
+        # Der Dienst schließt daraufhin seine Seite, damit endet auch der Empfangs-Thread
+        self._receiver.join(timeout=5)
+        self._conn.close()
+
+
+class RemoteStorage(Storage):
+    """
+    :class:`utils.storage.Storage` eines Shard-Prozesses: liest selbst über den eigenen
+    Leser-Pool, schreibt aber über den :class:`StorageService`. Ein Schreibzugriff ist
+    abgeschlossen, wenn er committet ist; ein Lesezugriff danach sieht ihn also.
+    """
+
+    def __init__(self, path, client, readers=4):
+        super().__init__(path, readers=readers)
+        self.client = client
+
+    async def write(self, fn, *args, label=None):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(self.client.submit(self.path, fn, args))
+        finally:
+            observer = self.observer
+            if observer is not None:
+                observer(label or fn.__qualname__, time.perf_counter() - started)
+
+    def write_sync(self, fn, *args):
+        return self.client.submit(self.path, fn, args).result()
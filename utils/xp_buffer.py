@@ -0,0 +1,145 @@
+import time
+
+
+class XPBuffer:
+    """
+    Sammelt XP-Gutschriften im Speicher und schreibt sie gebündelt in die Datenbank.
+
+    Der Puffer kennt für jeden gesehenen User den aktuellen Stand (XP und Level),
+    damit Level-Ups sofort erkannt werden, obwohl noch nichts geschrieben wurde.
+    Pro User werden nur Deltas festgehalten; beim Flush landen alle in einer Transaktion.
+    Coins aus Level-Belohnungen laufen als Delta mit, damit sie zusammen mit dem Level-Up
+    gespeichert werden. Jeder Puffer gehört zu genau einer Gilde.
+    """
+
+    def __init__(self, db, guild_id, flush_size=500):
+        self.db = db
+        self.guild_id = guild_id
+        self.flush_size = flush_size
+        self._state = {}  # user_id -> [xp, level]
+        self._pending = {}  # user_id -> [xp_gain, levels_gained, reset, coins]
+        self.last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def _load(self, user_id):
+        state = self._state.get(user_id)
+        if state is None:
+            row = await self.db.fetchone("SELECT xp, level FROM users WHERE guild_id = ? AND user_id = ?", (self.guild_id, user_id))
+            # Während des Ladens kann eine andere Nachricht desselben Users schneller gewesen sein
+            state = self._state.setdefault(user_id, list(row) if row else [0, 1])
+        return state
+
+    def get(self, user_id):
+        """Gibt (xp, level) aus dem gepufferten Stand zurück, falls der User bekannt ist."""
+        state = self._state.get(user_id)
+        return tuple(state) if state else None
+
+    async def add_xp(self, user_id, amount):
+        """
+        Schreibt XP gut und gibt das neue Level zurück, wenn dabei ein Level-Up passiert ist.
+
+        :param user_id: Die ID des Users.
+        :param amount: Die Menge an XP.
+        :return: Das neue Level oder ``None``.
+        """
+        state = await self._load(user_id)
+        pending = self._pending.setdefault(user_id, [0, 0, False, 0])
+
+        state[0] += amount
+        pending[0] += amount
+
+        if state[0] >= state[1] * 100:
+            # Level-Up: XP werden wie bisher auf 0 zurückgesetzt
+            state[1] += 1
+            state[0] = 0
+            pending[0] = 0
+            pending[1] += 1
+            pending[2] = True
+            return state[1]
+        return None
+
+    def add_coins(self, user_id, amount):
+        """Schreibt Coins mit dem nächsten Flush gut, z. B. als Belohnung für ein Level-Up."""
+        self._pending.setdefault(user_id, [0, 0, False, 0])[3] += amount
+
+    def pending_coins(self, user_id):
+        pending = self._pending.get(user_id)
+        return pending[3] if pending else 0
+
+    def should_flush(self):
+        return len(self._pending) >= self.flush_size
+
+    def forget(self, user_id):
+        """
+        Verwirft den zwischengespeicherten Stand, z. B. nachdem ein Befehl das Level direkt geändert hat.
+
+        Gutgeschriebene Coins bleiben erhalten, sie hängen nicht vom Level ab.
+        """
+        self._state.pop(user_id, None)
+        pending = self._pending.pop(user_id, None)
+        if pending and pending[3]:
+            self._pending[user_id] = [0, 0, False, pending[3]]
+
+    def reset(self):
+        """Verwirft alle zwischengespeicherten Stände, z. B. nach einem Saisonwechsel."""
+        self._state.clear()
+        self._pending.clear()
+
+    def _take(self):
+        self.last_flush = time.monotonic()
+        pending, self._pending = self._pending, {}
+        rows = []
+        for user_id, (xp_gain, levels, reset, coins) in pending.items():
+            # Nach forget() ist nur noch ein Coin-Delta übrig, der Stand wird dann nicht angefasst
+            xp, level = self._state.get(user_id, (0, 1))
+            rows.append((self.guild_id, user_id, xp, level, levels, reset, xp_gain, coins))
+        return pending, rows
+
+    @staticmethod
+    def _write(conn, rows):
+        conn.executemany("""
+            INSERT INTO users (guild_id, user_id, xp, level, coins) VALUES (?1, ?2, ?3, ?4, ?8)
+            ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                level = level + ?5,
+                xp = CASE WHEN ?6 THEN ?3 ELSE xp + ?7 END,
+                coins = coins + ?8
+        """, rows)
+
+    def _restore(self, pending):
+        # Nichts verlieren: Deltas für den nächsten Versuch zurücklegen
+        for user_id, (xp_gain, levels, reset, coins) in pending.items():
+            current = self._pending.setdefault(user_id, [0, 0, False, 0])
+            current[1] += levels
+            current[3] += coins
+            if not current[2]:
+                current[0] += xp_gain
+                current[2] = reset
+
+    async def flush(self):
+        """Schreibt alle offenen Deltas in einer einzigen Transaktion. Gibt die Anzahl der User zurück."""
+        if not self._pending:
+            self.last_flush = time.monotonic()
+            return 0
+
+        pending, rows = self._take()
+        try:
+            await self.db.write(self._write, rows)
+        except Exception:
+            self._restore(pending)
+            raise
+        return len(rows)
+
+    def flush_sync(self):
+        """Blockierender Flush für das Entladen des Cogs, wenn kein Await mehr möglich ist."""
+        if not self._pending:
+            return 0
+
+        pending, rows = self._take()
+        try:
+            self.db.write_sync(self._write, rows)
+        except Exception:
+            self._restore(pending)
+            raise
+        return len(rows)